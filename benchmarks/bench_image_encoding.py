@@ -0,0 +1,117 @@
+"""
+Compare the old disk round-trip image encoding with the in-memory path.
+
+Images are extracted once from the bundled attention_is_all_you_need.pdf with
+marker (or rendered straight from the PDF with --render-pages, which needs no
+models), then encoded repeatedly with each strategy.
+
+Usage:
+    python benchmarks/bench_image_encoding.py [--render-pages] [--rounds 5]
+"""
+
+import os
+import sys
+import time
+import base64
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from marker_api.utils import (  # noqa: E402
+    IMAGE_WORKERS,
+    encode_images,
+    process_image_to_base64,
+)
+
+PDF_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "examples",
+    "data",
+    "attention_is_all_you_need.pdf",
+)
+
+
+def extract_images_with_marker(pdf_path):
+    from marker.convert import convert_single_pdf
+    from marker.models import load_all_models
+
+    model_list = load_all_models()
+    with open(pdf_path, "rb") as f:
+        _, images, _ = convert_single_pdf(f.read(), model_list)
+    return images
+
+
+def render_pages(pdf_path):
+    import pypdfium2 as pdfium
+
+    doc = pdfium.PdfDocument(pdf_path)
+    return {
+        f"_page_{i}.png": doc[i].render(scale=2).to_pil() for i in range(len(doc))
+    }
+
+
+def encode_via_disk(images):
+    """
+    The encoding path parse_pdf_and_return_markdown used before: save, read, delete.
+    """
+    image_data = {}
+    workdir = tempfile.mkdtemp()
+    for filename, image in images.items():
+        path = os.path.join(workdir, filename)
+        image.save(path, "PNG")
+        with open(path, "rb") as f:
+            image_data[filename] = base64.b64encode(f.read()).decode("utf-8")
+        os.remove(path)
+    os.rmdir(workdir)
+    return image_data
+
+
+def encode_in_memory_serial(images):
+    return {
+        filename: process_image_to_base64(image, filename)
+        for filename, image in images.items()
+    }
+
+
+def bench(name, fn, images, rounds):
+    fn(images)  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(images)
+    elapsed = (time.perf_counter() - start) / rounds
+    per_image = elapsed / len(images) * 1000
+    print(f"{name:<24} {elapsed * 1000:10.1f} ms/doc {per_image:10.2f} ms/image")
+    return per_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pdf", default=PDF_PATH, help="PDF to extract images from")
+    parser.add_argument(
+        "--render-pages",
+        action="store_true",
+        help="Render PDF pages instead of running marker (no models needed)",
+    )
+    parser.add_argument("--rounds", type=int, default=5, help="Timed rounds per mode")
+    args = parser.parse_args()
+
+    if args.render_pages:
+        images = render_pages(args.pdf)
+    else:
+        images = extract_images_with_marker(args.pdf)
+    if not images:
+        print("No images extracted, nothing to benchmark")
+        return
+
+    print(f"{len(images)} images, {IMAGE_WORKERS} encoding workers\n")
+    disk = bench("disk round-trip", encode_via_disk, images, args.rounds)
+    serial = bench("in-memory (serial)", encode_in_memory_serial, images, args.rounds)
+    pooled = bench("in-memory (pooled)", encode_images, images, args.rounds)
+    print(f"\nSaved per image: {disk - serial:.2f} ms serial", end="")
+    print(f", {disk - pooled:.2f} ms pooled")
+
+
+if __name__ == "__main__":
+    main()
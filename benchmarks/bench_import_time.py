@@ -0,0 +1,100 @@
+"""
+Measure the cold-start import time of the API servers.
+
+Every round imports a module in a fresh interpreter, as a new API process does,
+and the median wall time is reported. `-X importtime` then shows which imported
+packages account for most of it.
+
+Usage:
+    python benchmarks/bench_import_time.py [--rounds 5] [--top 10]
+    python benchmarks/bench_import_time.py --module marker_api.demo  # demo cost
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MODULES = ["server", "distributed_server"]
+
+TIMER = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def import_seconds(module: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", TIMER.format(module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def package_import_times(code: str) -> dict:
+    """
+    Cumulative import time of every package imported by `code`, from -X importtime.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[12:].split("|"))
+        if not cumulative.isdigit():
+            continue
+        # Only packages, their submodules are already in the cumulative time. A
+        # package includes whatever it imported first, e.g. marker includes torch
+        if "." not in name:
+            packages[name] = max(packages.get(name, 0), int(cumulative))
+    return packages
+
+
+def top_imports(module: str, top: int):
+    packages = package_import_times(f"import {module}")
+    # Leave out the module itself and what the interpreter imports on its own
+    for name in [module, *package_import_times("pass")]:
+        packages.pop(name, None)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    for name, micros in ranked[:top]:
+        print(f"    {name:<32} {micros / 1e6:8.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--module",
+        action="append",
+        help="Module to import, repeatable (default: both servers)",
+    )
+    parser.add_argument("--rounds", type=int, default=5, help="Imports per module")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages shown")
+    args = parser.parse_args()
+
+    for module in args.module or MODULES:
+        try:
+            times = [import_seconds(module) for _ in range(args.rounds)]
+        except subprocess.CalledProcessError as e:
+            print(f"{module}: import failed\n{e.stderr}")
+            continue
+        print(
+            f"{module:<24} median {statistics.median(times):6.2f} s "
+            f"(min {min(times):.2f}, max {max(times):.2f})"
+        )
+        if args.top:
+            top_imports(module, args.top)
+
+
+if __name__ == "__main__":
+    main()
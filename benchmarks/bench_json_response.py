@@ -0,0 +1,144 @@
+"""
+Compare FastAPI's response_model serialization with ConversionJSONResponse.
+
+A synthetic but realistically sized conversion result (several MB of markdown
+plus base64 images) is returned by two endpoints of an in-process app: one
+through `response_model=ConversionResponse`, as the conversion endpoints used
+to, and one as a ConversionJSONResponse. Both go through the same TestClient,
+so the difference is the serialization path. The serialization alone is then
+timed without any transport, through FastAPI's own serialize_response.
+
+Usage:
+    python benchmarks/bench_json_response.py [--markdown-mb 2] [--images 20]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import base64
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from marker_api.delivery import ConversionJSONResponse, orjson  # noqa: E402
+from marker_api.model.schema import ConversionResponse  # noqa: E402
+
+WORDS = (
+    "attention transformer encoder decoder layer softmax équation $x_i^2$ "
+    "**bold** `code` | table | cell | —"
+).split()
+
+
+def build_result(markdown_mb: float, images: int, image_kb: int) -> dict:
+    rng = random.Random(0)
+    lines = []
+    size = 0
+    while size < markdown_mb * 1024**2:
+        line = " ".join(rng.choice(WORDS) for _ in range(16))
+        lines.append(line)
+        size += len(line) + 1
+    return {
+        "filename": "paper.pdf",
+        "markdown": "\n".join(lines),
+        "metadata": {
+            "languages": ["English"],
+            "toc": [{"title": f"Section {i}", "page": i} for i in range(50)],
+            "pages": 40,
+            "custom_metadata": {"cache_hit": False},
+        },
+        "images": {
+            f"_page_{i}_Figure_0.png": base64.b64encode(
+                rng.randbytes(image_kb * 1024)
+            ).decode("ascii")
+            for i in range(images)
+        },
+        "status": "ok",
+    }
+
+
+def build_app(result: dict) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/response-model", response_model=ConversionResponse)
+    def response_model():
+        return ConversionResponse(status="Success", result=result)
+
+    @app.get("/fast", response_model=ConversionResponse)
+    def fast():
+        return ConversionJSONResponse({"status": "Success", "result": result})
+
+    return app
+
+
+def bench(client: TestClient, path: str, rounds: int) -> float:
+    body = client.get(path).content  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        client.get(path)
+    elapsed = (time.perf_counter() - start) / rounds * 1000
+    print(f"{path:<16} {elapsed:10.1f} ms/response {len(body) / 1024**2:8.2f} MB")
+    return elapsed
+
+
+def time_it(name: str, fn, rounds: int) -> float:
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    elapsed = (time.perf_counter() - start) / rounds * 1000
+    print(f"{name:<16} {elapsed:10.1f} ms/response")
+    return elapsed
+
+
+def bench_serialization(app: FastAPI, result: dict, rounds: int):
+    route = next(r for r in app.routes if getattr(r, "path", "") == "/response-model")
+
+    loop = asyncio.new_event_loop()
+
+    def response_model():
+        # What FastAPI 0.115 does with an endpoint's return value and response_model
+        content = loop.run_until_complete(
+            serialize_response(
+                field=route.response_field,
+                response_content=ConversionResponse(status="Success", result=result),
+            )
+        )
+        return JSONResponse(content).body
+
+    def fast():
+        return ConversionJSONResponse({"status": "Success", "result": result}).body
+
+    slow = time_it("response_model", response_model, rounds)
+    quick = time_it("orjson", fast, rounds)
+    print(f"\nSpeedup: {slow / quick:.1f}x")
+    loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--markdown-mb", type=float, default=2, help="Markdown size")
+    parser.add_argument("--images", type=int, default=20, help="Number of images")
+    parser.add_argument("--image-kb", type=int, default=100, help="Size of an image")
+    parser.add_argument("--rounds", type=int, default=20, help="Timed rounds per mode")
+    args = parser.parse_args()
+
+    result = build_result(args.markdown_mb, args.images, args.image_kb)
+    print(f"Serializer: {'orjson' if orjson is not None else 'json (no orjson)'}\n")
+    app = build_app(result)
+    print("Through the app:")
+    with TestClient(app) as client:
+        slow = bench(client, "/response-model", args.rounds)
+        fast = bench(client, "/fast", args.rounds)
+    print(f"\nSpeedup: {slow / fast:.1f}x\n")
+    print("Serialization only:")
+    bench_serialization(app, result, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
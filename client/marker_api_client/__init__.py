@@ -6,6 +6,7 @@ from enum import Enum
 from pydantic import BaseModel
 from tqdm import tqdm
 from tqdm.asyncio import tqdm as atqdm
+from urllib3.util import make_headers
 import logging
 
 # Set up logging
@@ -14,6 +15,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Every encoding requests can decode here: gzip and deflate, plus br and zstd when
+# brotli and zstandard are installed (pip install marker-api-client[compression])
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
 
 class ServerType(str, Enum):
     simple = "simple"
@@ -45,11 +50,14 @@ class MarkerAPIClient:
     def __init__(self, base_url: str):
         self.base_url = base_url.rstrip("/")
         self.session = requests.Session()
+        # Conversion results are large, let the server compress them
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
         self.server_type = None
         logger.info(f"Initializing MarkerAPIClient with base URL: {self.base_url}")
 
     async def __aenter__(self):
-        self.async_session = aiohttp.ClientSession()
+        # aiohttp advertises and decodes gzip and deflate, and br with brotli installed
+        self.async_session = aiohttp.ClientSession(auto_decompress=True)
         await self.acheck_health()
         return self
 
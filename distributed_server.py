@@ -1,28 +1,45 @@
 import argparse
 import uvicorn
 import logging
-from fastapi import FastAPI, UploadFile, File
-from celery.exceptions import TimeoutError
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
-from marker_api.celery_worker import celery_app
+from fastapi.responses import JSONResponse
+from kombu.exceptions import OperationalError
+from redis.exceptions import ConnectionError as RedisConnectionError
+from marker_api.async_results import is_pool_exhausted
 from marker_api.utils import print_markerapi_text_art
 from marker.logger import configure_logging
 from marker_api.celery_routes import (
     celery_convert_pdf,
     celery_result,
     celery_convert_pdf_concurrent_await,
+    celery_convert_pdf_stream,
     celery_batch_convert,
     celery_batch_result,
+    celery_breaker,
+    get_tenant,
+    result_store,
+    task_listener,
+    worker_registry,
+)
+from marker_api.compression import CompressionMiddleware
+from marker_api.delivery import STREAM_PAGES
+from marker_api.lazy_demo import DEMO, demo_app, mount_demo
+from marker_api.uploads import (
+    UploadLimitMiddleware,
+    UploadTooLargeError,
+    upload_too_large_handler,
 )
-import gradio as gr
-from marker_api.demo import demo_ui
 from marker_api.model.schema import (
     BatchConversionResponse,
     BatchResultResponse,
     CeleryResultResponse,
     CeleryTaskResponse,
+    ConversionOptions,
     ConversionResponse,
     HealthResponse,
+    ImageDelivery,
     ServerType,
 )
 from typing import List
@@ -31,8 +48,21 @@ from typing import List
 configure_logging()
 logger = logging.getLogger(__name__)
 
-# Global variable to hold model list
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A single listener wakes every request waiting on a Celery task
+    await task_listener.start()
+    # Health checks answer from a snapshot refreshed in the background
+    worker_registry.start()
+    yield
+    worker_registry.stop()
+    await task_listener.stop()
+    await result_store.close()
+    await demo_app.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 logger.info("Configuring CORS middleware")
 app.add_middleware(
@@ -42,6 +72,11 @@ app.add_middleware(
     allow_headers=["*"],
     allow_credentials=True,
 )
+# Oversized bodies are refused before they are read, files are capped while spooled
+app.add_middleware(UploadLimitMiddleware)
+app.add_exception_handler(UploadTooLargeError, upload_too_large_handler)
+# Markdown and base64 images compress well, for clients that accept it
+app.add_middleware(CompressionMiddleware)
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -52,56 +87,140 @@ def server():
     Returns:
     HealthResponse: A welcome message, server type, and number of workers (if distributed).
     """
-    worker_count = len(celery_app.control.inspect().stats() or {})
-    server_type = ServerType.distributed if worker_count > 0 else ServerType.simple
+    snapshot = worker_registry.snapshot
+    if snapshot.worker_count == 0:
+        return HealthResponse(message="Welcome to Marker-api", type=ServerType.simple)
     return HealthResponse(
         message="Welcome to Marker-api",
-        type=server_type,
-        workers=worker_count if server_type == ServerType.distributed else None,
+        type=ServerType.distributed,
+        workers=snapshot.worker_count,
+        concurrency=snapshot.concurrency,
+        queues=snapshot.queue_depths,
     )
 
 
-def is_celery_alive() -> bool:
-    logger.debug("Checking if Celery is alive")
-    try:
-        result = celery_app.send_task("celery.ping")
-        result.get(timeout=3)
-        logger.info("Celery is alive")
-        return True
-    except (TimeoutError, Exception) as e:
-        logger.warning(f"Celery is not responding: {str(e)}")
-        return False
+def celery_unavailable_headers() -> dict:
+    return {"Retry-After": str(celery_breaker.retry_after)}
 
 
-def setup_routes(app: FastAPI, celery_live: bool):
-    logger.info("Setting up routes")
-    if celery_live:
-        logger.info("Adding Celery routes")
-
-        @app.post("/convert", response_model=ConversionResponse)
-        async def convert_pdf(pdf_file: UploadFile = File(...)):
-            return await celery_convert_pdf_concurrent_await(pdf_file)
-
-        @app.post("/celery/convert", response_model=CeleryTaskResponse)
-        async def celery_convert(pdf_file: UploadFile = File(...)):
-            return await celery_convert_pdf(pdf_file)
+def require_celery():
+    """
+    Reject requests with a 503 while the Celery circuit is open.
+    """
+    if celery_breaker.is_open:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Celery is unavailable: {celery_breaker.reason}",
+            headers=celery_unavailable_headers(),
+        )
+
+
+@app.exception_handler(OperationalError)
+@app.exception_handler(RedisConnectionError)
+async def celery_connection_error(request: Request, exc: Exception):
+    if is_pool_exhausted(exc):
+        # Redis is fine, this process is just serving more requests than it has
+        # connections for: shed this one without opening the circuit
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Too many concurrent requests, retry shortly"},
+            headers={"Retry-After": "1"},
+        )
+    # Don't wait for the next probe to stop sending requests to a dead broker
+    celery_breaker.trip(str(exc))
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Celery is unavailable: {str(exc)}"},
+        headers=celery_unavailable_headers(),
+    )
 
-        @app.get("/celery/result/{task_id}", response_model=CeleryResultResponse)
-        async def get_celery_result(task_id: str):
-            return await celery_result(task_id)
 
-        @app.post("/batch_convert", response_model=BatchConversionResponse)
-        async def batch_convert(pdf_files: List[UploadFile] = File(...)):
-            return await celery_batch_convert(pdf_files)
+def setup_routes(app: FastAPI, demo: bool = DEMO):
+    # Registered even when Celery is down: require_celery answers 503 until it is back
+    logger.info("Adding Celery routes")
+    celery_required = [Depends(require_celery)]
 
-        @app.get("/batch_convert/result/{task_id}", response_model=BatchResultResponse)
-        async def get_batch_result(task_id: str):
-            return await celery_batch_result(task_id)
+    @app.post(
+        "/convert", response_model=ConversionResponse, dependencies=celery_required
+    )
+    async def convert_pdf(
+        pdf_file: UploadFile = File(...),
+        image_delivery: ImageDelivery = ImageDelivery.base64,
+        options: ConversionOptions = Depends(),
+        tenant: str = Depends(get_tenant),
+    ):
+        return await celery_convert_pdf_concurrent_await(
+            pdf_file, image_delivery, options, tenant
+        )
+
+    @app.post("/convert/stream", dependencies=celery_required)
+    async def convert_pdf_stream(
+        pdf_file: UploadFile = File(...),
+        pages_per_chunk: int = Query(STREAM_PAGES, ge=1),
+        options: ConversionOptions = Depends(),
+        tenant: str = Depends(get_tenant),
+    ):
+        return await celery_convert_pdf_stream(
+            pdf_file, pages_per_chunk, options, tenant
+        )
+
+    @app.post(
+        "/celery/convert",
+        response_model=CeleryTaskResponse,
+        dependencies=celery_required,
+    )
+    async def celery_convert(
+        pdf_file: UploadFile = File(...),
+        options: ConversionOptions = Depends(),
+        tenant: str = Depends(get_tenant),
+    ):
+        return await celery_convert_pdf(pdf_file, options, tenant)
+
+    @app.get(
+        "/celery/result/{task_id}",
+        response_model=CeleryResultResponse,
+        dependencies=celery_required,
+    )
+    async def get_celery_result(
+        task_id: str,
+        image_delivery: ImageDelivery = ImageDelivery.base64,
+        delete: bool = False,
+    ):
+        """
+        With `delete=true` the result is removed once fetched, instead of expiring.
+        """
+        return await celery_result(task_id, image_delivery, delete)
+
+    @app.post(
+        "/batch_convert",
+        response_model=BatchConversionResponse,
+        dependencies=celery_required,
+    )
+    async def batch_convert(
+        pdf_files: List[UploadFile] = File(...),
+        options: ConversionOptions = Depends(),
+        tenant: str = Depends(get_tenant),
+    ):
+        return await celery_batch_convert(pdf_files, options, tenant)
+
+    @app.get(
+        "/batch_convert/result/{task_id}",
+        response_model=BatchResultResponse,
+        dependencies=celery_required,
+    )
+    async def get_batch_result(
+        task_id: str,
+        image_delivery: ImageDelivery = ImageDelivery.base64,
+        delete: bool = False,
+    ):
+        """
+        With `delete=true` the results are removed once all of them are fetched.
+        """
+        return await celery_batch_result(task_id, image_delivery, delete)
 
-        logger.info("Adding real-time conversion route")
-    else:
-        logger.warning("Celery routes not added as Celery is not alive")
-    app = gr.mount_gradio_app(app, demo_ui, path="")
+    # Mounted at the root, so it must come after every API route
+    if demo:
+        mount_demo(app)
 
 
 def parse_args():
@@ -113,6 +232,12 @@ def parse_args():
     parser.add_argument(
         "--port", type=int, default=8080, help="Port to run the FastAPI app"
     )
+    parser.add_argument(
+        "--demo",
+        action="store_true",
+        default=DEMO,
+        help="Serve the Gradio demo UI at /",
+    )
     return parser.parse_args()
 
 
@@ -120,8 +245,7 @@ if __name__ == "__main__":
     args = parse_args()
     print_markerapi_text_art()
     logger.info(f"Starting FastAPI app on {args.host}:{args.port}")
-    celery_alive = is_celery_alive()
-    setup_routes(app, celery_alive)
+    setup_routes(app, demo=args.demo)
     try:
         uvicorn.run(app, host=args.host, port=args.port)
     except Exception as e:
@@ -0,0 +1,137 @@
+import os
+import math
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+from marker_api.workers import WorkerRegistry
+
+logger = logging.getLogger(__name__)
+
+# Requests whose estimated wait exceeds this many seconds are rejected (0 disables)
+WAIT_SLO = float(os.environ.get("MARKER_API_WAIT_SLO", "300"))
+# Per-page service time assumed until conversions have been observed
+PAGE_SECONDS = float(os.environ.get("MARKER_API_PAGE_SECONDS", "2"))
+# Pages per task assumed until conversions have been observed
+TASK_PAGES = float(os.environ.get("MARKER_API_TASK_PAGES", "10"))
+# Weight of the newest observation in the moving averages
+EWMA_ALPHA = float(os.environ.get("MARKER_API_EWMA_ALPHA", "0.2"))
+
+
+class WaitEstimate:
+    """
+    Expected queueing delay and service time of a request at admission.
+    """
+
+    def __init__(self, wait: float, service: float, outstanding: int):
+        self.wait = wait
+        self.service = service
+        self.outstanding = outstanding
+        self.start = time.time() + wait
+
+
+class AdmissionRejectedError(Exception):
+    """
+    Raised when the estimated wait of a request exceeds the SLO.
+    """
+
+    def __init__(self, estimate: WaitEstimate, slo: float):
+        self.estimate = estimate
+        # Roughly the time the backlog needs to drain below the SLO
+        self.retry_after = max(1, math.ceil(estimate.wait - slo))
+        super().__init__(
+            f"Estimated wait of {estimate.wait:.0f}s exceeds the {slo:.0f}s SLO"
+        )
+
+
+class AdmissionController:
+    """
+    Sheds load before it is enqueued, based on the backlog and observed service time.
+
+    The backlog comes from the worker registry's snapshot, plus the tasks admitted
+    since that snapshot was taken. Service times are exponentially weighted
+    moving averages of the per-page time and pages per task of finished
+    conversions, fed from the task completion listener.
+    """
+
+    def __init__(
+        self,
+        registry: WorkerRegistry,
+        slo: float = WAIT_SLO,
+        page_seconds: float = PAGE_SECONDS,
+        task_pages: float = TASK_PAGES,
+        alpha: float = EWMA_ALPHA,
+    ):
+        self.registry = registry
+        self.slo = slo
+        self.page_seconds = page_seconds
+        self.task_pages = task_pages
+        self.alpha = alpha
+        self._admitted = 0
+        self._snapshot_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, meta: Dict[str, Any]):
+        """
+        Update the service time averages from a finished task's stored meta.
+        """
+        result = meta.get("result")
+        if meta.get("status") != "SUCCESS" or not isinstance(result, dict):
+            return
+        metadata = result.get("metadata") or {}
+        custom_metadata = metadata.get("custom_metadata") or {}
+        # Cache hits and merged shards say nothing about the cost of inference
+        if custom_metadata.get("cache_hit") or "shards" in custom_metadata:
+            return
+        pages = metadata.get("pages")
+        seconds = result.get("time")
+        if not pages or seconds is None:
+            return
+        with self._lock:
+            self.page_seconds += self.alpha * (seconds / pages - self.page_seconds)
+            self.task_pages += self.alpha * (pages - self.task_pages)
+
+    def estimate(self, pages: Optional[int] = None, tasks: int = 1) -> WaitEstimate:
+        """
+        Estimate how long a request would queue and run if admitted now.
+
+        Args:
+        pages (int): Total pages of the request, or None if unknown.
+        tasks (int): Number of tasks the request enqueues.
+
+        Returns:
+        WaitEstimate: The estimated wait before the first task starts.
+        """
+        snapshot = self.registry.snapshot
+        with self._lock:
+            if snapshot.updated_at != self._snapshot_at:
+                # The new snapshot already counts what was admitted before it
+                self._snapshot_at = snapshot.updated_at
+                self._admitted = 0
+            outstanding = snapshot.outstanding + self._admitted
+            page_seconds = self.page_seconds
+            task_seconds = self.task_pages * page_seconds
+        concurrency = max(snapshot.concurrency, 1)
+        wait = max(0, outstanding - concurrency + 1) * task_seconds / concurrency
+        if pages is None:
+            pages = tasks * task_seconds / page_seconds
+        service = pages * page_seconds / min(tasks, concurrency)
+        return WaitEstimate(wait, service, outstanding)
+
+    def admit(self, pages: Optional[int] = None, tasks: int = 1) -> WaitEstimate:
+        """
+        Admit a request, counting its tasks towards the backlog.
+
+        Raises:
+        AdmissionRejectedError: If the estimated wait exceeds the SLO.
+        """
+        estimate = self.estimate(pages, tasks)
+        if self.slo > 0 and estimate.wait > self.slo:
+            logger.warning(
+                f"Rejecting request: estimated wait {estimate.wait:.0f}s "
+                f"with {estimate.outstanding} tasks outstanding"
+            )
+            raise AdmissionRejectedError(estimate, self.slo)
+        with self._lock:
+            self._admitted += tasks
+        return estimate
@@ -0,0 +1,146 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from marker_api.result_storage import (
+    RESULT_EXPIRES,
+    delete_result,
+    is_result_ref,
+    resolve_result,
+)
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.environ.get("REDIS_HOST", "redis://localhost:6379/0")
+REDIS_POOL_SIZE = int(os.environ.get("MARKER_API_REDIS_POOL_SIZE", "50"))
+# Seconds a request waits for a free pooled connection when all of them are in use
+REDIS_POOL_TIMEOUT = float(os.environ.get("MARKER_API_REDIS_POOL_TIMEOUT", "5"))
+
+# Key prefixes used by the Celery Redis result backend
+TASK_KEY_PREFIX = "celery-task-meta-"
+GROUP_KEY_PREFIX = "celery-taskset-meta-"
+# Marks results deleted on request, so readers tell them apart from pending tasks
+FORGOTTEN_PREFIX = "marker-api:forgotten:"
+READY_STATES = {"SUCCESS", "FAILURE", "REVOKED"}
+# Raised by redis-py's connection pools (as ConnectionError) when they are exhausted
+POOL_EXHAUSTED_MESSAGES = ("No connection available.", "Too many connections")
+
+
+def decode_task_meta(payload) -> Optional[Dict[str, Any]]:
+    """
+    Decode a result payload written by the Celery Redis backend (json serializer).
+    """
+    if payload is None:
+        return None
+    if isinstance(payload, bytes):
+        payload = payload.decode("utf-8")
+    return json.loads(payload)
+
+
+def is_ready(meta: Optional[Dict[str, Any]]) -> bool:
+    return meta is not None and meta.get("status") in READY_STATES
+
+
+def is_pool_exhausted(exc: Exception) -> bool:
+    """
+    Whether a Redis ConnectionError means the pool ran out of connections, rather
+    than that Redis is unreachable.
+    """
+    return str(exc) in POOL_EXHAUSTED_MESSAGES
+
+
+class AsyncResultStore:
+    """
+    asyncio-native read access to the Celery Redis result backend.
+
+    Replaces AsyncResult.ready(), .info and .get() in async handlers, which are
+    blocking Redis round-trips, with calls on a pooled redis.asyncio client.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = REDIS_URL,
+        pool_size: int = REDIS_POOL_SIZE,
+        pool_timeout: float = REDIS_POOL_TIMEOUT,
+    ):
+        import redis.asyncio as aioredis
+
+        # Bursts beyond the pool size queue for a connection instead of failing
+        self.pool = aioredis.BlockingConnectionPool.from_url(
+            redis_url, max_connections=pool_size, timeout=pool_timeout
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+
+    async def get_meta(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns:
+        dict: The stored task meta (status, result, ...), or None while pending.
+        """
+        return decode_task_meta(await self.client.get(f"{TASK_KEY_PREFIX}{task_id}"))
+
+    async def get_many(self, task_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Fetch the meta of several tasks in a single MGET.
+        """
+        if not task_ids:
+            return []
+        payloads = await self.client.mget(
+            [f"{TASK_KEY_PREFIX}{task_id}" for task_id in task_ids]
+        )
+        return [decode_task_meta(payload) for payload in payloads]
+
+    async def get_group_members(self, group_id: str) -> Optional[List[str]]:
+        """
+        Read the ids of the members of a group saved with GroupResult.save().
+
+        Returns:
+        list: The member task ids in submission order, or None for an unknown group.
+        """
+        meta = decode_task_meta(await self.client.get(f"{GROUP_KEY_PREFIX}{group_id}"))
+        if meta is None:
+            return None
+        # Saved as GroupResult.as_tuple(): ((id, parent), [((id, parent), None), ...])
+        _, members = meta["result"]
+        return [member[0][0] for member in members]
+
+    async def load_result(self, result: Any) -> Any:
+        """
+        Return the full result of a task, reading it from the blob store if the
+        backend only holds a pointer to it.
+        """
+        if not is_result_ref(result):
+            return result
+        return await asyncio.to_thread(resolve_result, result)
+
+    async def forget(self, task_ids: List[str], metas: Optional[List[Any]] = None):
+        """
+        Delete the stored results of tasks, and the payloads their metas point to.
+
+        The tasks are remembered as deleted until their results would have expired,
+        for requests that attached to the same task and read it later.
+        """
+        if task_ids:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.delete(*[f"{TASK_KEY_PREFIX}{task_id}" for task_id in task_ids])
+                for task_id in task_ids:
+                    pipe.set(
+                        f"{FORGOTTEN_PREFIX}{task_id}", 1, ex=max(RESULT_EXPIRES, 60)
+                    )
+                await pipe.execute()
+        for meta in metas or []:
+            if meta is not None and is_result_ref(meta.get("result")):
+                await asyncio.to_thread(delete_result, meta["result"])
+
+    async def is_forgotten(self, task_id: str) -> bool:
+        """
+        Whether the result of a task was deleted with `forget`.
+        """
+        return bool(await self.client.exists(f"{FORGOTTEN_PREFIX}{task_id}"))
+
+    async def forget_group(self, group_id: str):
+        await self.client.delete(f"{GROUP_KEY_PREFIX}{group_id}")
+
+    async def close(self):
+        await self.client.aclose()
+        await self.pool.aclose()
@@ -0,0 +1,196 @@
+import os
+import time
+import inspect
+import logging
+import importlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Stages whose model calls are batched across requests: a comma separated list of
+# BATCH_TARGETS names, "all", or empty to disable
+DYNAMIC_BATCHING = os.environ.get("MARKER_API_DYNAMIC_BATCHING", "")
+# Flush a batch as soon as it holds this many images
+BATCH_MAX_ITEMS = int(os.environ.get("MARKER_API_BATCH_MAX_ITEMS", "64"))
+# Longest time the first call of a batch waits for others to join
+BATCH_MAX_WAIT_MS = float(os.environ.get("MARKER_API_BATCH_MAX_WAIT_MS", "20"))
+
+# Model calls made by marker: (module, function, arguments holding one entry per image)
+BATCH_TARGETS: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "detection": ("marker.ocr.detection", "batch_text_detection", ("images",)),
+    "recognition": (
+        "marker.ocr.recognition",
+        "run_recognition",
+        ("images", "langs", "bboxes", "polygons"),
+    ),
+    "layout": (
+        "marker.layout.layout",
+        "batch_layout_detection",
+        ("images", "detection_results"),
+    ),
+    "ordering": ("marker.layout.order", "batch_ordering", ("images", "bboxes")),
+    "texify": ("marker.equations.equations", "batch_inference", ("images",)),
+}
+
+_SCALARS = (int, float, str, bool, type(None))
+
+
+class _PendingCall:
+    def __init__(self, arguments: dict, size: int):
+        self.arguments = arguments
+        self.size = size
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class DynamicBatcher:
+    """
+    Merges concurrent calls of a batched model function into one call.
+
+    The first call for a given model and settings waits up to `max_wait` seconds,
+    or until `max_items` images are pending, then runs the function once on the
+    concatenated per-image arguments and hands every caller its slice of the
+    results. Calls are made on the caller's thread, so it only pays off when
+    several conversions run at once, e.g. with more than one inference worker.
+
+    Args:
+    fn: The batched function, returning one result per image.
+    list_params (tuple): Names of the arguments holding one entry per image.
+    max_items (int): Number of pending images that flushes a batch early.
+    max_wait (float): Seconds the first call waits for others to join.
+    """
+
+    def __init__(
+        self,
+        fn,
+        list_params: Tuple[str, ...],
+        max_items: int = BATCH_MAX_ITEMS,
+        max_wait: float = BATCH_MAX_WAIT_MS / 1000,
+    ):
+        self.fn = fn
+        self.signature = inspect.signature(fn)
+        self.list_params = list_params
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._pending: Dict[tuple, List[_PendingCall]] = {}
+
+    def _key(self, arguments: dict) -> tuple:
+        # Only calls with the same model and settings can share a batch
+        key = []
+        for name, value in arguments.items():
+            if name in self.list_params:
+                key.append((name, value is None))
+            elif isinstance(value, _SCALARS):
+                key.append((name, value))
+            else:
+                key.append((name, id(value)))
+        return tuple(key)
+
+    def __call__(self, *args, **kwargs):
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        size = len(arguments[self.list_params[0]])
+        if size == 0 or size >= self.max_items:
+            return self.fn(*args, **kwargs)
+
+        key = self._key(arguments)
+        call = _PendingCall(arguments, size)
+        with self._cond:
+            calls = self._pending.setdefault(key, [])
+            calls.append(call)
+            leader = len(calls) == 1
+            self._cond.notify_all()
+        if leader:
+            self._lead(key)
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _lead(self, key: tuple):
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while True:
+                pending = sum(call.size for call in self._pending[key])
+                remaining = deadline - time.monotonic()
+                if pending >= self.max_items or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # Anything arriving from now on starts the next batch
+            calls = self._pending.pop(key)
+
+        arguments = dict(calls[0].arguments)
+        for name in self.list_params:
+            if arguments.get(name) is not None:
+                arguments[name] = [
+                    item for call in calls for item in call.arguments[name]
+                ]
+        try:
+            results = self.fn(**arguments)
+            total = sum(call.size for call in calls)
+            if len(results) != total:
+                raise RuntimeError(
+                    f"{self.fn.__name__} returned {len(results)} results "
+                    f"for {total} images"
+                )
+            if len(calls) > 1:
+                logger.debug(f"Batched {len(calls)} calls of {self.fn.__name__}")
+            offset = 0
+            for call in calls:
+                call.result = results[offset : offset + call.size]
+                offset += call.size
+        except BaseException as e:
+            for call in calls:
+                call.error = e
+        finally:
+            for call in calls[1:]:
+                call.done.set()
+
+
+def install_batching(stages: str = DYNAMIC_BATCHING) -> List[str]:
+    """
+    Replace marker's model calls with dynamic batchers.
+
+    Stages whose module or function can't be found in the installed marker
+    version are skipped.
+
+    Args:
+    stages (str): Comma separated BATCH_TARGETS names, or "all".
+
+    Returns:
+    list: The stages that were patched.
+    """
+    names = [name.strip() for name in stages.split(",") if name.strip()]
+    if names == ["all"]:
+        names = list(BATCH_TARGETS)
+
+    installed = []
+    for name in names:
+        if name not in BATCH_TARGETS:
+            logger.warning(f"Unknown batching stage {name}, skipping")
+            continue
+        module_name, function_name, list_params = BATCH_TARGETS[name]
+        try:
+            module = importlib.import_module(module_name)
+            fn = getattr(module, function_name)
+        except (ImportError, AttributeError) as e:
+            logger.warning(f"Cannot batch {name}: {str(e)}")
+            continue
+        if isinstance(fn, DynamicBatcher):
+            installed.append(name)
+            continue
+        parameters = inspect.signature(fn).parameters
+        if not all(param in parameters for param in list_params):
+            logger.warning(f"Cannot batch {name}: unexpected {function_name} signature")
+            continue
+        setattr(module, function_name, DynamicBatcher(fn, list_params))
+        installed.append(name)
+
+    if installed:
+        logger.info(f"Dynamic batching enabled for {', '.join(installed)}")
+    return installed
@@ -0,0 +1,223 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE = os.environ.get("MARKER_API_BLOB_STORE", "local").lower()
+BLOB_DIR = os.environ.get("MARKER_API_BLOB_DIR", "/tmp/marker-api-blobs")
+S3_BUCKET = os.environ.get("MARKER_API_S3_BUCKET", "marker-api")
+S3_PREFIX = os.environ.get("MARKER_API_S3_PREFIX", "")
+# Point this at MinIO or any other S3 compatible stand-in for local testing
+S3_ENDPOINT_URL = os.environ.get("MARKER_API_S3_ENDPOINT_URL") or None
+
+# Uploads left behind by tasks that never ran or failed before cleaning up are
+# removed after this many seconds (0 keeps them)
+UPLOAD_EXPIRES = int(os.environ.get("MARKER_API_UPLOAD_EXPIRES", "86400"))
+UPLOAD_PREFIX = "uploads"
+
+# Keys are generated by the API, anything else is rejected before touching storage
+KEY_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+(/[A-Za-z0-9_\-.]+)*$")
+
+
+class BlobNotFoundError(Exception):
+    """
+    Raised when a blob does not exist, e.g. because it was already cleaned up.
+    """
+
+
+def new_blob_key(prefix: str = UPLOAD_PREFIX, suffix: str = ".pdf") -> str:
+    """
+    Return a fresh, unique key for an uploaded document.
+    """
+    return f"{prefix}/{uuid.uuid4().hex}{suffix}"
+
+
+def _check_key(key: str) -> str:
+    if not KEY_PATTERN.match(key) or ".." in key:
+        raise ValueError(f"Invalid blob key: {key}")
+    return key
+
+
+class BlobStore(ABC):
+    """
+    Storage for payloads too large to travel through the Celery broker.
+
+    Tasks carry only the key, and workers fetch the bytes themselves.
+    """
+
+    @abstractmethod
+    def put(self, data: bytes, key: Optional[str] = None) -> str:
+        """
+        Store `data` under `key`, or under a new upload key, and return the key.
+        """
+
+    @abstractmethod
+    def put_file(self, path: str, key: Optional[str] = None) -> str:
+        """
+        Store the file at `path` under `key`, or under a new upload key.
+        """
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """
+        Raises:
+        BlobNotFoundError: If there is no blob under `key`.
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """
+        Remove the blob under `key`, if there is one.
+        """
+
+    @abstractmethod
+    def delete_older_than(self, prefix: str, seconds: float) -> int:
+        """
+        Remove the blobs under `prefix` last written more than `seconds` ago.
+
+        Returns:
+        int: The number of blobs removed.
+        """
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blob store on a local directory, or on a volume shared by the API and workers.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, _check_key(key))
+
+    def put(self, data: bytes, key: Optional[str] = None) -> str:
+        key = key or new_blob_key()
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return key
+
+    def put_file(self, path: str, key: Optional[str] = None) -> str:
+        key = key or new_blob_key()
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+        return key
+
+    def get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobNotFoundError(key)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_older_than(self, prefix: str, seconds: float) -> int:
+        cutoff = time.time() - seconds
+        removed = 0
+        for directory, _, filenames in os.walk(self._path(prefix)):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class S3BlobStore(BlobStore):
+    """
+    Blob store on S3 or any S3 compatible service.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, key: str) -> str:
+        key = _check_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, data: bytes, key: Optional[str] = None) -> str:
+        key = key or new_blob_key()
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+        return key
+
+    def put_file(self, path: str, key: Optional[str] = None) -> str:
+        key = key or new_blob_key()
+        self.client.upload_file(path, self.bucket, self._key(key))
+        return key
+
+    def get(self, key: str) -> bytes:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.client.exceptions.NoSuchKey:
+            raise BlobNotFoundError(key)
+        return response["Body"].read()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_older_than(self, prefix: str, seconds: float) -> int:
+        # A lifecycle rule on the prefix does the same without listing the bucket
+        cutoff = time.time() - seconds
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(Bucket=self.bucket, Prefix=f"{self._key(prefix)}/")
+        removed = 0
+        for page in pages:
+            expired = [
+                {"Key": item["Key"]}
+                for item in page.get("Contents", [])
+                if item["LastModified"].timestamp() < cutoff
+            ]
+            if expired:
+                # A listed page holds at most 1000 keys, the delete_objects limit
+                self.client.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": expired, "Quiet": True}
+                )
+                removed += len(expired)
+        return removed
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """
+    Return the process-wide blob store, configured from the environment on first use.
+    """
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            if BLOB_STORE == "s3":
+                _blob_store = S3BlobStore(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL)
+            else:
+                if BLOB_STORE != "local":
+                    logger.warning(f"Unknown blob store {BLOB_STORE}, using local")
+                _blob_store = LocalBlobStore(BLOB_DIR)
+        return _blob_store
@@ -0,0 +1,71 @@
+import os
+import time
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failed liveness probes before the circuit opens
+BREAKER_THRESHOLD = int(os.environ.get("MARKER_API_BREAKER_THRESHOLD", "2"))
+# Retry-After sent to clients while the circuit is open
+BREAKER_RETRY_AFTER = int(os.environ.get("MARKER_API_BREAKER_RETRY_AFTER", "5"))
+
+
+class CircuitBreaker:
+    """
+    Tracks whether a backend is reachable so requests can fail fast while it is not.
+
+    The circuit opens after `failure_threshold` consecutive failures, or at once
+    when a request hits a connection error, and closes again on the first
+    successful probe.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_THRESHOLD,
+        retry_after: int = BREAKER_RETRY_AFTER,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(
+                    f"{self.name} is back after {time.time() - self.opened_at:.1f}s, "
+                    "closing circuit"
+                )
+            self.failures = 0
+            self.opened_at = None
+            self.reason = None
+
+    def record_failure(self, reason: str):
+        with self._lock:
+            self.failures += 1
+            self.reason = reason
+            if self.opened_at is None and self.failures >= self.failure_threshold:
+                self._open()
+
+    def trip(self, reason: str):
+        """
+        Open the circuit immediately, e.g. after a connection error on a request.
+        """
+        with self._lock:
+            self.reason = reason
+            if self.opened_at is None:
+                self._open()
+
+    def _open(self):
+        self.opened_at = time.time()
+        logger.warning(f"{self.name} is unavailable, opening circuit: {self.reason}")
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of cached results changes so stale entries are ignored
+CACHE_VERSION = "1"
+
+CACHE_MEMORY_BYTES = int(
+    os.environ.get("MARKER_API_CACHE_MEMORY_BYTES", str(256 * 1024**2))
+)
+CACHE_BACKEND = os.environ.get("MARKER_API_CACHE_BACKEND", "").lower()
+CACHE_DIR = os.environ.get("MARKER_API_CACHE_DIR", "/tmp/marker-api-cache")
+CACHE_REDIS_URL = os.environ.get(
+    "MARKER_API_CACHE_REDIS_URL",
+    os.environ.get("REDIS_HOST", "redis://localhost:6379/0"),
+)
+CACHE_TTL = int(os.environ.get("MARKER_API_CACHE_TTL", str(24 * 3600)))
+
+
+def content_digest(data: bytes) -> str:
+    """
+    Return the SHA-256 hex digest of an uploaded document.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str, chunk_size: int = 1024**2) -> str:
+    """
+    Return the SHA-256 hex digest of a document on disk, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _marker_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("marker-pdf")
+    except Exception:
+        return "unknown"
+
+
+def cache_key(digest: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build the cache key for a document digest and the options it was converted with.
+
+    The marker version is part of the key, so upgrading the models never serves
+    results produced by an older pipeline.
+    """
+    payload = json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "marker": _marker_version(),
+            "digest": digest,
+            "options": options or {},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def conversion_key(file_content: Union[bytes, str], options: Dict[str, Any]) -> str:
+    """
+    Build the key identifying a conversion of this PDF content with these options.
+
+    The same key is used by the result cache and by in-flight request coalescing.
+    Options must already be normalized, so equivalent requests share a key.
+    `file_content` may also be the path of the PDF.
+    """
+    if isinstance(file_content, str):
+        return cache_key(file_digest(file_content), options)
+    return cache_key(content_digest(file_content), options)
+
+
+class MemoryCache:
+    """
+    In-process LRU tier that evicts by the serialized size of its entries.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class DiskCache:
+    """
+    Shared tier backed by a local directory or a volume mounted on every worker.
+    """
+
+    name = "disk"
+
+    def __init__(self, directory: str, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, value: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+
+class RedisCache:
+    """
+    Shared tier stored in Redis with a TTL on every entry.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, ttl: int):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"marker-api:cache:{key}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self._key(key))
+
+    def put(self, key: str, value: bytes):
+        self.client.set(self._key(key), value, ex=self.ttl or None)
+
+
+class ResultCache:
+    """
+    Two-tier conversion result cache.
+
+    Lookups try the in-process LRU first and fall back to the optional shared tier,
+    promoting shared hits into memory. Errors in the shared tier are logged and
+    treated as misses so a cache outage never fails a conversion.
+    """
+
+    def __init__(self, memory: Optional[MemoryCache] = None, shared=None):
+        self.memory = memory
+        self.shared = shared
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Returns:
+        tuple: The cached result and the name of the tier it came from, or (None, None).
+        """
+        if self.memory is not None:
+            value = self.memory.get(key)
+            if value is not None:
+                return json.loads(value), self.memory.name
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared cache lookup failed: {str(e)}")
+                value = None
+            if value is not None:
+                if self.memory is not None:
+                    self.memory.put(key, value)
+                return json.loads(value), self.shared.name
+        return None, None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        value = json.dumps(result).encode("utf-8")
+        if self.memory is not None:
+            self.memory.put(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.put(key, value)
+            except Exception as e:
+                logger.warning(f"Shared cache store failed: {str(e)}")
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Return the process-wide result cache, configured from the environment on first use.
+    """
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            memory = None
+            if CACHE_MEMORY_BYTES > 0:
+                memory = MemoryCache(CACHE_MEMORY_BYTES)
+            shared = None
+            if CACHE_BACKEND == "redis":
+                shared = RedisCache(CACHE_REDIS_URL, CACHE_TTL)
+            elif CACHE_BACKEND == "disk":
+                shared = DiskCache(CACHE_DIR, CACHE_TTL)
+            elif CACHE_BACKEND:
+                logger.warning(
+                    f"Unknown cache backend {CACHE_BACKEND}, using memory only"
+                )
+            _result_cache = ResultCache(memory=memory, shared=shared)
+        return _result_cache
+
+
+def annotate_cache_status(
+    result: Dict[str, Any], tier: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Record in the result metadata whether it came from the cache, and which tier.
+    """
+    metadata = result.get("metadata")
+    if isinstance(metadata, dict):
+        custom_metadata = metadata.setdefault("custom_metadata", {})
+        custom_metadata["cache_hit"] = tier is not None
+        if tier is not None:
+            custom_metadata["cache_tier"] = tier
+    return result
+
+
+def lookup_result(key: str, filename: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetch a cached conversion result and re-label it for the current upload.
+
+    Args:
+    key (str): The cache key built by `cache_key`.
+    filename (str): The filename of the current upload.
+
+    Returns:
+    dict: The conversion result, or None on a miss.
+    """
+    entry_time = time.time()
+    cached, tier = get_result_cache().get(key)
+    if cached is None:
+        return None
+    logger.info(f"Cache hit ({tier}) for {filename}")
+    cached["filename"] = filename
+    cached["time"] = time.time() - entry_time
+    return annotate_cache_status(cached, tier)
+
+
+def store_result(key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cache a fresh conversion result without its per-request fields.
+    """
+    cacheable = {k: v for k, v in result.items() if k not in ("filename", "time")}
+    get_result_cache().put(key, cacheable)
+    return annotate_cache_status(result, None)
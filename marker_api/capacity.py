@@ -0,0 +1,252 @@
+"""
+Capacity planning: how many conversions, model replicas or Celery worker
+processes fit in this machine's RAM or VRAM.
+
+Usage:
+    python -m marker_api.capacity measure
+    python -m marker_api.capacity {conversions,replicas,celery} [--json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+import subprocess
+from typing import Optional, Tuple
+from marker_api.executor import REPLICA_THREADS
+from marker_api.utils import DeviceType, get_ram_available
+
+logger = logging.getLogger(__name__)
+
+# Memory of one loaded set of models; measured (and cached) when not set
+REPLICA_MEMORY_MB = os.environ.get("MARKER_API_REPLICA_MEMORY_MB")
+# Working memory of one running conversion on top of the models
+CONVERSION_MEMORY_MB = int(os.environ.get("MARKER_API_CONVERSION_MEMORY_MB", "1024"))
+# Share of the available memory the plan may use
+MEMORY_HEADROOM = float(os.environ.get("MARKER_API_MEMORY_HEADROOM", "0.9"))
+CAPACITY_CACHE = os.path.expanduser(
+    os.environ.get("MARKER_API_CAPACITY_CACHE", "~/.cache/marker-api/capacity.json")
+)
+
+
+def _process_memory_mb(device: DeviceType) -> float:
+    import torch
+
+    if device == DeviceType.GPU:
+        return torch.cuda.memory_allocated() / 1024**2
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:
+        import resource
+
+        # Peak rather than current RSS, still fine right after loading the models
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _marker_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("marker-pdf")
+    except Exception:
+        return "unknown"
+
+
+def _cache_entry(device: DeviceType) -> str:
+    return f"{device.value}:marker-pdf=={_marker_version()}"
+
+
+def _read_cache() -> dict:
+    try:
+        with open(CAPACITY_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(device: DeviceType, replica_mb: float):
+    cache = _read_cache()
+    cache[_cache_entry(device)] = replica_mb
+    try:
+        os.makedirs(os.path.dirname(CAPACITY_CACHE), exist_ok=True)
+        with open(CAPACITY_CACHE, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        logger.warning(f"Could not cache replica memory: {str(e)}")
+
+
+def load_models_measured(load_models=None) -> Tuple[list, float]:
+    """
+    Load the models and measure how much memory one replica takes.
+
+    The measurement is cached, so later plans don't need to load the models.
+
+    Returns:
+    tuple: The loaded models and their memory in MB.
+    """
+    if load_models is None:
+        from marker.models import load_all_models as load_models
+
+    device, _ = get_ram_available()
+    before = _process_memory_mb(device)
+    model_list = load_models()
+    replica_mb = max(1.0, _process_memory_mb(device) - before)
+    logger.info(f"One model replica takes {replica_mb:.0f} MB on {device.value}")
+    _write_cache(device, replica_mb)
+    return model_list, replica_mb
+
+
+def replica_memory_mb() -> float:
+    """
+    Memory of one model replica in MB, from the environment, the cache, or a
+    measurement in a separate process so this one stays free of models.
+    """
+    if REPLICA_MEMORY_MB:
+        return float(REPLICA_MEMORY_MB)
+    device, _ = get_ram_available()
+    cached = _read_cache().get(_cache_entry(device))
+    if cached is None:
+        logger.info("Measuring model replica memory, this loads the models once")
+        # Captured, so callers like `$(python -m marker_api.capacity celery)` only
+        # ever see their own output
+        measured = subprocess.run(
+            [sys.executable, "-m", "marker_api.capacity", "measure"],
+            capture_output=True,
+            text=True,
+        )
+        if measured.returncode != 0:
+            logger.error(f"Measuring replica memory failed:\n{measured.stderr}")
+            measured.check_returncode()
+        cached = _read_cache().get(_cache_entry(device))
+        if cached is None:
+            # The cache could not be written, the measurement is printed last
+            cached = measured.stdout.strip().splitlines()[-1]
+    return float(cached)
+
+
+class CapacityPlan:
+    """
+    What fits in the memory available to this machine or container.
+
+    Args:
+    device (DeviceType): Where the models run.
+    available_mb (float): Free VRAM or available RAM in MB.
+    replica_mb (float): Memory of one loaded set of models in MB.
+    conversion_mb (float): Working memory of one running conversion in MB.
+    models_loaded (bool): Whether this process already holds a replica, which
+    `available_mb` then no longer includes.
+    """
+
+    def __init__(
+        self,
+        device: DeviceType,
+        available_mb: float,
+        replica_mb: float,
+        conversion_mb: float = CONVERSION_MEMORY_MB,
+        models_loaded: bool = False,
+    ):
+        self.device = device
+        self.available_mb = available_mb
+        self.replica_mb = replica_mb
+        self.conversion_mb = conversion_mb
+        self.budget_mb = available_mb * MEMORY_HEADROOM + (
+            replica_mb if models_loaded else 0
+        )
+
+    @property
+    def _core_limit(self) -> Optional[int]:
+        if self.device == DeviceType.GPU:
+            return None
+        return max(1, (os.cpu_count() or 1) // REPLICA_THREADS)
+
+    def _limit(self, count: float) -> int:
+        count = max(1, int(count))
+        core_limit = self._core_limit
+        return count if core_limit is None else min(count, core_limit)
+
+    @property
+    def conversions(self) -> int:
+        """
+        Concurrent conversions sharing one set of models in a single process.
+        """
+        return max(1, int((self.budget_mb - self.replica_mb) // self.conversion_mb))
+
+    def replicas(self, shared_weights: bool = False) -> int:
+        """
+        Processes that each hold a replica and run one conversion at a time.
+
+        Args:
+        shared_weights (bool): Whether the replicas share one copy of the weights,
+        as forked CPU replicas do copy-on-write.
+        """
+        if shared_weights:
+            count = (self.budget_mb - self.replica_mb) // self.conversion_mb
+        else:
+            count = self.budget_mb // (self.replica_mb + self.conversion_mb)
+        return self._limit(count)
+
+    @property
+    def celery_workers(self) -> int:
+        """
+        Celery prefork processes; each child loads its own models on start.
+        """
+        return self.replicas(shared_weights=False)
+
+    def as_dict(self) -> dict:
+        return {
+            "device": self.device.value,
+            "available_mb": round(self.available_mb),
+            "replica_mb": round(self.replica_mb),
+            "conversion_mb": round(self.conversion_mb),
+            "conversions": self.conversions,
+            "replicas": self.replicas(self.device == DeviceType.CPU),
+            "celery": self.celery_workers,
+        }
+
+
+def plan_capacity(
+    replica_mb: Optional[float] = None, models_loaded: bool = False
+) -> CapacityPlan:
+    """
+    Plan capacity from the memory available right now.
+
+    Args:
+    replica_mb (float): Memory of one replica, see replica_memory_mb if None.
+    models_loaded (bool): Whether this process already loaded its models.
+
+    Returns:
+    CapacityPlan: The plan.
+    """
+    device, available_mb = get_ram_available()
+    if replica_mb is None:
+        replica_mb = replica_memory_mb()
+    plan = CapacityPlan(device, available_mb, replica_mb, models_loaded=models_loaded)
+    logger.info(f"Capacity plan: {plan.as_dict()}")
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "target",
+        choices=["measure", "conversions", "replicas", "celery"],
+        help="Measure replica memory, or print how many of these fit",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the whole plan")
+    args = parser.parse_args()
+
+    if args.target == "measure":
+        _, replica_mb = load_models_measured()
+        print(round(replica_mb))
+        return
+    plan = plan_capacity()
+    if args.json:
+        print(json.dumps(plan.as_dict()))
+    else:
+        print(plan.as_dict()[args.target])
+
+
+if __name__ == "__main__":
+    main()
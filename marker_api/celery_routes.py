@@ -1,65 +1,495 @@
-from fastapi import UploadFile, File
+from fastapi import Depends, Header, UploadFile, File, Query
+from celery import chord
 from celery.result import AsyncResult
-from fastapi.responses import JSONResponse
-from marker_api.celery_tasks import convert_pdf_to_markdown, process_batch
+from fastapi.responses import JSONResponse, StreamingResponse
+from marker_api.celery_tasks import (
+    convert_pdf_to_markdown,
+    delete_blob,
+    merge_shards,
+    process_batch,
+)
+from marker_api.admission import (
+    AdmissionController,
+    AdmissionRejectedError,
+    WaitEstimate,
+)
+from marker_api.blob_store import BlobNotFoundError, get_blob_store
+from marker_api.async_results import AsyncResultStore, is_ready
+from marker_api.breaker import CircuitBreaker
+from marker_api.task_events import TaskCompletionListener, TaskFailedError
+from marker_api.celery_worker import BULK_QUEUE, INTERACTIVE_QUEUE, celery_app
+from marker_api.cache import cache_key
+from marker_api.coalesce import (
+    claim_inflight_task,
+    coalesced_result,
+    release_inflight_task,
+)
+from marker_api.fairshare import (
+    ANONYMOUS_TENANT,
+    release_task,
+    schedule_tasks,
+    tenant_id,
+)
+from marker_api.delivery import (
+    NDJSON_MEDIA_TYPE,
+    ConversionJSONResponse,
+    STREAM_PAGES,
+    ndjson_line,
+    page_windows,
+    split_images,
+    zip_response,
+)
+from marker_api.model.schema import ConversionOptions, ImageDelivery
+from marker_api.routing import DeviceRouter, DocumentCost, estimate_cost
+from marker_api.uploads import SpooledUpload, spool_upload, spool_uploads
+from marker_api.utils import normalize_options
+from marker_api.workers import WorkerRegistry
+import os
 import logging
 import asyncio
-from typing import List
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# PDFs with more pages than the threshold are split across workers (0 disables)
+SHARD_THRESHOLD = int(os.environ.get("MARKER_API_SHARD_THRESHOLD", "0"))
+SHARD_PAGES = int(os.environ.get("MARKER_API_SHARD_PAGES", "20"))
+# Seconds a synchronous /convert waits for its task
+TASK_TIMEOUT = float(os.environ.get("MARKER_API_TASK_TIMEOUT", "600"))
 
-async def celery_convert_pdf(pdf_file: UploadFile = File(...)):
-    contents = await pdf_file.read()
-    task_id = convert_pdf_to_markdown.delay(pdf_file.filename, contents)
-    return {"task_id": str(task_id), "status": "Processing"}
+# Started and stopped by the distributed server's lifespan
+# Opened by the registry's liveness probes, so requests fail fast while Celery is down
+celery_breaker = CircuitBreaker("Celery")
+worker_registry = WorkerRegistry(celery_app, breaker=celery_breaker)
+admission = AdmissionController(worker_registry)
+device_router = DeviceRouter(worker_registry)
+# Async handlers read results through this pool, never through blocking AsyncResults
+result_store = AsyncResultStore()
+task_listener = TaskCompletionListener(result_store, on_complete=admission.observe)
 
 
-async def celery_result(task_id: str):
-    task = AsyncResult(task_id)
-    if not task.ready():
+def get_tenant(x_api_key: Optional[str] = Header(None)) -> str:
+    """
+    Identify the tenant of a request by its X-API-Key header.
+    """
+    return tenant_id(x_api_key)
+
+
+class StartedConversion:
+    """
+    A conversion task started by a request, or the one it attached to.
+    """
+
+    def __init__(
+        self,
+        task: AsyncResult,
+        coalesced: bool,
+        estimate: Optional[WaitEstimate] = None,
+        queue: Optional[str] = None,
+        priority: Optional[int] = None,
+    ):
+        self.task = task
+        self.coalesced = coalesced
+        self.estimate = estimate
+        self.queue = queue
+        self.priority = priority
+
+
+def document_cost(path: str) -> Optional[DocumentCost]:
+    try:
+        return estimate_cost(path)
+    except Exception as e:
+        # Not for us to reject, the worker reports unreadable PDFs
+        logger.debug(f"Could not estimate document cost: {str(e)}")
+        return None
+
+
+def admit_uploads(
+    uploads: List[SpooledUpload],
+) -> Tuple[WaitEstimate, List[Optional[DocumentCost]]]:
+    """
+    Estimate the cost of the uploads and admit one task per upload.
+
+    Returns:
+    tuple: The wait estimate and the cost of each upload (None if unreadable).
+
+    Raises:
+    AdmissionRejectedError: If the estimated wait exceeds the SLO.
+    """
+    costs = [document_cost(upload.path) for upload in uploads]
+    pages = None if None in costs else sum(cost.pages for cost in costs)
+    return admission.admit(pages, tasks=len(uploads)), costs
+
+
+def admission_rejected_response(e: AdmissionRejectedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"status": "Error", "message": str(e)},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def scheduling_fields(
+    estimate: Optional[WaitEstimate],
+    queue: Optional[str] = None,
+    priority: Optional[int] = None,
+) -> dict:
+    fields = {"queue": queue, "priority": priority}
+    if estimate is not None:
+        fields["estimated_wait"] = round(estimate.wait, 1)
+        fields["estimated_start"] = datetime.fromtimestamp(estimate.start, timezone.utc)
+    return fields
+
+
+def shard_windows(page_count: Optional[int]) -> Optional[List[Tuple[int, int]]]:
+    """
+    Page ranges a PDF is split into, or None if it is converted in one task.
+    """
+    if SHARD_THRESHOLD <= 0 or page_count is None or page_count <= SHARD_THRESHOLD:
+        return None
+    return page_windows(page_count, SHARD_PAGES)
+
+
+def start_sharded_task(
+    filename: str,
+    path: str,
+    options: dict,
+    key: str,
+    task_id: str,
+    page_count: Optional[int],
+    queue: str,
+    priority: int,
+):
+    """
+    Split a large PDF into page ranges converted in parallel and merged in order.
+
+    Returns:
+    AsyncResult: The merge callback, started with `task_id`, or None if the
+    PDF is below the shard threshold.
+    """
+    windows = shard_windows(page_count)
+    if windows is None:
+        return None
+    logger.info(f"Sharding {filename} ({page_count} pages) into {len(windows)} tasks")
+    # Every shard reads the same upload, which the merge step (or a failure) removes
+    blob_key = get_blob_store().put_file(path)
+    header = [
+        convert_pdf_to_markdown.s(
+            filename,
+            blob_key,
+            options,
+            start_page=start_page,
+            max_pages=max_pages,
+            cleanup=False,
+        ).set(queue=queue, priority=priority)
+        for start_page, max_pages in windows
+    ]
+    body = merge_shards.s(filename, key, blob_key).set(
+        task_id=task_id, queue=queue, priority=priority
+    )
+    body.on_error(delete_blob.si(blob_key, key, task_id))
+    return chord(header)(body)
+
+
+def start_conversion_task(
+    upload: SpooledUpload,
+    options: ConversionOptions,
+    tenant: str = ANONYMOUS_TENANT,
+    lane: str = INTERACTIVE_QUEUE,
+) -> StartedConversion:
+    """
+    Start a conversion task, or attach to the one already running for the same PDF.
+
+    The spooled PDF is copied to the blob store and only its key is sent to the
+    broker. This blocks on Redis and the blob store, so call it off the event loop.
+
+    Returns:
+    StartedConversion: The task, with its wait estimate, queue and priority
+    unless it was started by another request.
+
+    Raises:
+    AdmissionRejectedError: If a new task would wait longer than the SLO.
+    """
+    filename = upload.filename
+    options = normalize_options(options.model_dump())
+    # Same key the worker derives from the blob, without reading the file again
+    key = cache_key(upload.digest, options)
+    task_id = str(uuid.uuid4())
+    client = celery_app.backend.client
+    existing_id = claim_inflight_task(client, key, task_id)
+    if existing_id is not None:
+        # Attaching adds no work, so it is never rejected
+        logger.info(f"Attaching {filename} to in-flight task {existing_id}")
+        return StartedConversion(AsyncResult(existing_id), True)
+    cost = document_cost(upload.path)
+    page_count = cost.pages if cost is not None else None
+    windows = shard_windows(page_count)
+    try:
+        # A sharded PDF queues one conversion per shard (the merge is negligible)
+        estimate = admission.admit(page_count, tasks=len(windows) if windows else 1)
+    except AdmissionRejectedError:
+        release_inflight_task(client, key, task_id)
+        raise
+    queue = device_router.route(lane, cost)
+    priority = schedule_tasks(client, tenant, [task_id], lane)[0]
+    try:
+        task = start_sharded_task(
+            filename, upload.path, options, key, task_id, page_count, queue, priority
+        )
+        if task is None:
+            blob_key = get_blob_store().put_file(upload.path)
+            task = convert_pdf_to_markdown.apply_async(
+                args=(filename, blob_key, options),
+                kwargs={"inflight_key": key},
+                task_id=task_id,
+                queue=queue,
+                priority=priority,
+            )
+    except Exception:
+        release_task(client, task_id)
+        release_inflight_task(client, key, task_id)
+        raise
+    return StartedConversion(task, False, estimate, queue, priority)
+
+
+async def celery_convert_pdf(
+    pdf_file: UploadFile = File(...),
+    options: ConversionOptions = Depends(),
+    tenant: str = ANONYMOUS_TENANT,
+):
+    upload = await spool_upload(pdf_file)
+    try:
+        started = await asyncio.to_thread(
+            start_conversion_task, upload, options, tenant
+        )
+    except AdmissionRejectedError as e:
+        return admission_rejected_response(e)
+    finally:
+        # The blob store has its own copy by now
+        upload.close()
+    return {
+        "task_id": str(started.task.id),
+        "status": "Processing",
+        **scheduling_fields(started.estimate, started.queue, started.priority),
+    }
+
+
+def result_expired_response(task_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=404,
+        content={"task_id": task_id, "status": "Error", "message": "Result expired"},
+    )
+
+
+async def celery_result(
+    task_id: str,
+    image_delivery: ImageDelivery = ImageDelivery.base64,
+    delete: bool = False,
+):
+    meta = await result_store.get_meta(task_id)
+    if meta is None and await result_store.is_forgotten(task_id):
+        # Deleted by another request that shared this task
+        return result_expired_response(task_id)
+    if not is_ready(meta):
         return JSONResponse(
             status_code=202, content={"task_id": str(task_id), "status": "Processing"}
         )
-    result = task.get()
-    return {"task_id": task_id, "status": "Success", "result": result}
+    if meta["status"] != "SUCCESS":
+        return JSONResponse(
+            status_code=500,
+            content={
+                "task_id": task_id,
+                "status": "Error",
+                "message": str(meta.get("result")),
+            },
+        )
+    try:
+        result = await result_store.load_result(meta["result"])
+    except BlobNotFoundError:
+        return result_expired_response(task_id)
+    if delete:
+        # Fetched for good, free the backend instead of waiting for the expiry
+        await result_store.forget([task_id], [meta])
+    if image_delivery == ImageDelivery.zip:
+        results, files = split_images([result])
+        return await zip_response(
+            {"task_id": task_id, "status": "Success", "result": results[0]}, files
+        )
+    return ConversionJSONResponse(
+        {"task_id": task_id, "status": "Success", "result": result}
+    )
 
 
 async def celery_offline_root():
     return {"message": "Celery is offline. No API is available."}
 
 
-async def celery_convert_pdf_sync(pdf_file: UploadFile = File(...)):
-    contents = await pdf_file.read()
-    task = convert_pdf_to_markdown.delay(pdf_file.filename, contents)
-    result = task.get(timeout=600)  # 10-minute timeout
-    return {"status": "Success", "result": result}
-
+async def celery_convert_pdf_sync(
+    pdf_file: UploadFile = File(...),
+    options: ConversionOptions = Depends(),
+    tenant: str = ANONYMOUS_TENANT,
+):
+    upload = await spool_upload(pdf_file)
+    try:
+        started = await asyncio.to_thread(
+            start_conversion_task, upload, options, tenant
+        )
+    except AdmissionRejectedError as e:
+        return admission_rejected_response(e)
+    finally:
+        # The blob store has its own copy by now
+        upload.close()
+    try:
+        result = await task_listener.wait(started.task.id, timeout=TASK_TIMEOUT)
+    except BlobNotFoundError:
+        return result_expired_response(str(started.task.id))
+    if started.coalesced:
+        result = coalesced_result(result, pdf_file.filename)
+    return ConversionJSONResponse({"status": "Success", "result": result})
 
-async def celery_convert_pdf_concurrent_await(pdf_file: UploadFile = File(...)):
-    contents = await pdf_file.read()
 
-    # Start the Celery task
-    task = convert_pdf_to_markdown.delay(pdf_file.filename, contents)
+async def celery_convert_pdf_concurrent_await(
+    pdf_file: UploadFile = File(...),
+    image_delivery: ImageDelivery = ImageDelivery.base64,
+    options: ConversionOptions = Depends(),
+    tenant: str = ANONYMOUS_TENANT,
+):
+    upload = await spool_upload(pdf_file)
 
-    # Define an asynchronous function to check task status
-    async def check_task_status():
-        while True:
-            if task.ready():
-                return task.get()
-            await asyncio.sleep(1)  # Wait for 1 second before checking again
+    # Start the Celery task, or share the one already converting this PDF
+    try:
+        started = await asyncio.to_thread(
+            start_conversion_task, upload, options, tenant
+        )
+    except AdmissionRejectedError as e:
+        return admission_rejected_response(e)
+    finally:
+        upload.close()
 
     try:
-        # Wait for the task to complete with a timeout
-        result = await asyncio.wait_for(
-            check_task_status(), timeout=600
-        )  # 10-minute timeout
-        return {"status": "Success", "result": result}
+        # Woken by the completion listener as soon as the result is stored
+        result = await task_listener.wait(started.task.id, timeout=TASK_TIMEOUT)
+        if started.coalesced:
+            result = coalesced_result(result, pdf_file.filename)
+        if image_delivery == ImageDelivery.zip:
+            results, files = split_images([result])
+            body = {"status": "Success", "result": results[0]}
+            return await zip_response(body, files)
+        return ConversionJSONResponse({"status": "Success", "result": result})
     except asyncio.TimeoutError:
         return JSONResponse(
             status_code=408,
             content={"status": "Timeout", "message": "Task processing took too long"},
         )
+    except BlobNotFoundError:
+        # A request that shared the task fetched it with delete=true first
+        return result_expired_response(str(started.task.id))
+    except TaskFailedError as e:
+        logger.error(f"Conversion of {pdf_file.filename} failed: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "Error", "message": str(e.meta.get("result"))},
+        )
+
+
+async def celery_convert_pdf_stream(
+    pdf_file: UploadFile = File(...),
+    pages_per_chunk: int = Query(STREAM_PAGES, ge=1),
+    options: ConversionOptions = Depends(),
+    tenant: str = ANONYMOUS_TENANT,
+):
+    upload = await spool_upload(pdf_file)
+    filename = upload.filename
+    options = normalize_options(options.model_dump())
+    blob_store = get_blob_store()
+    try:
+        try:
+            cost = await asyncio.to_thread(estimate_cost, upload.path)
+        except Exception as e:
+            logger.error(f"Could not read {filename}: {str(e)}")
+            return JSONResponse(
+                status_code=400,
+                content={"status": "Error", "message": f"Could not read PDF: {e}"},
+            )
+        page_count = cost.pages
+        queue = device_router.route(INTERACTIVE_QUEUE, cost)
+        windows = page_windows(page_count, pages_per_chunk)
+        try:
+            admission.admit(page_count, tasks=len(windows))
+        except AdmissionRejectedError as e:
+            return admission_rejected_response(e)
+        blob_key = await asyncio.to_thread(blob_store.put_file, upload.path)
+    finally:
+        upload.close()
+
+    # Fan every window out at once so idle workers start on later pages right away
+    def start_tasks():
+        task_ids = [str(uuid.uuid4()) for _ in windows]
+        priorities = schedule_tasks(
+            celery_app.backend.client, tenant, task_ids, INTERACTIVE_QUEUE
+        )
+        return [
+            convert_pdf_to_markdown.apply_async(
+                args=(filename, blob_key, options),
+                kwargs={
+                    "start_page": start_page,
+                    "max_pages": max_pages,
+                    "cleanup": False,
+                },
+                task_id=task_id,
+                queue=queue,
+                priority=priority,
+            )
+            for (start_page, max_pages), task_id, priority in zip(
+                windows, task_ids, priorities
+            )
+        ]
+
+    tasks = await asyncio.to_thread(start_tasks)
+
+    async def events():
+        entry_time = time.time()
+        finished = 0
+        try:
+            for task in tasks:
+                try:
+                    chunk = await task_listener.wait(task.id, timeout=TASK_TIMEOUT)
+                except (TaskFailedError, BlobNotFoundError) as e:
+                    logger.error(f"Error streaming {filename}: {str(e)}")
+                    yield ndjson_line({"type": "error", "message": str(e)})
+                    return
+                except asyncio.TimeoutError:
+                    logger.error(f"Timed out streaming {filename}")
+                    message = "Task processing took too long"
+                    yield ndjson_line({"type": "error", "message": message})
+                    return
+                finished += 1
+                yield ndjson_line({"type": "pages", **chunk})
+            yield ndjson_line(
+                {
+                    "type": "done",
+                    "filename": filename,
+                    "pages": page_count,
+                    "time": time.time() - entry_time,
+                }
+            )
+        finally:
+            # Stop converting pages nobody is going to read
+            pending = [task.id for task in tasks[finished:]]
+            if pending:
+                await asyncio.to_thread(celery_app.control.revoke, pending)
+            await asyncio.to_thread(blob_store.delete, blob_key)
+            # Every chunk was sent, nobody is going to fetch them again
+            streamed = [task.id for task in tasks[:finished]]
+            if streamed:
+                await result_store.forget(
+                    streamed, await result_store.get_many(streamed)
+                )
+
+    return StreamingResponse(events(), media_type=NDJSON_MEDIA_TYPE)
 
 
 # async def celery_batch_convert(pdf_files: List[UploadFile] = File(...)):
@@ -107,57 +537,116 @@ async def celery_convert_pdf_concurrent_await(pdf_file: UploadFile = File(...)):
 #         )
 
 
-async def celery_batch_convert(pdf_files: List[UploadFile] = File(...)):
-    batch_data = []
-    for pdf_file in pdf_files:
-        contents = await pdf_file.read()
-        batch_data.append((pdf_file.filename, contents))
+async def celery_batch_convert(
+    pdf_files: List[UploadFile] = File(...),
+    options: ConversionOptions = Depends(),
+    tenant: str = ANONYMOUS_TENANT,
+):
+    # Spooled to disk one file at a time, so memory stays flat whatever the batch size
+    uploads = await spool_uploads(pdf_files)
+    try:
+        try:
+            estimate, costs = await asyncio.to_thread(admit_uploads, uploads)
+        except AdmissionRejectedError as e:
+            return admission_rejected_response(e)
 
-    # Start a single task to process the entire batch
-    task = process_batch.delay(batch_data)
+        blob_store = get_blob_store()
+        blob_keys = []
+        for upload in uploads:
+            blob_keys.append(await asyncio.to_thread(blob_store.put_file, upload.path))
+    finally:
+        for upload in uploads:
+            upload.close()
 
-    return {"task_id": str(task.id), "status": "Processing", "total": len(batch_data)}
+    # The tenant's later files drop in priority, so the batch can't starve others
+    task_ids = [str(uuid.uuid4()) for _ in uploads]
+    priorities = await asyncio.to_thread(
+        schedule_tasks, celery_app.backend.client, tenant, task_ids, BULK_QUEUE
+    )
+    # Each file is routed on its own cost, so a batch can span CPU and GPU workers
+    queues = [device_router.route(BULK_QUEUE, cost) for cost in costs]
+    batch_data = [
+        (upload.filename, blob_key, task_id, queue, priority)
+        for upload, blob_key, task_id, queue, priority in zip(
+            uploads, blob_keys, task_ids, queues, priorities
+        )
+    ]
 
+    # Start one task per file, spread over every available worker
+    task = await asyncio.to_thread(
+        process_batch, batch_data, normalize_options(options.model_dump())
+    )
 
-async def celery_batch_result(task_id: str):
-    task = AsyncResult(task_id)
+    return {
+        "task_id": str(task.id),
+        "status": "Processing",
+        "total": len(batch_data),
+        **scheduling_fields(estimate, queues[0], priorities[0]),
+    }
 
-    if not task.ready():
-        # Check if we can access task information
-        if task.info and isinstance(task.info, dict) and "current" in task.info:
-            current = task.info["current"]
-            total = task.info["total"]
-            return JSONResponse(
-                status_code=202,
-                content={
-                    "task_id": str(task_id),
-                    "status": "Processing",
-                    "progress": f"{current}/{total}",
-                    "percent": round((current / total) * 100, 2),
-                },
-            )
-        else:
-            return JSONResponse(
-                status_code=202,
-                content={
-                    "task_id": str(task_id),
-                    "status": "Processing",
-                },
-            )
 
-    try:
-        results = task.get()
+def failed_result(meta: dict) -> dict:
+    return {"status": "Error", "error": str(meta.get("result"))}
+
+
+async def celery_batch_result(
+    task_id: str,
+    image_delivery: ImageDelivery = ImageDelivery.base64,
+    delete: bool = False,
+):
+    member_ids = await result_store.get_group_members(task_id)
+    if member_ids is None:
+        return JSONResponse(
+            status_code=404,
+            content={"task_id": task_id, "status": "Error", "message": "Unknown batch"},
+        )
+
+    # One MGET for the state of every member of the group
+    metas = await result_store.get_many(member_ids)
+    if not all(is_ready(meta) for meta in metas):
+        current = sum(1 for meta in metas if is_ready(meta))
+        total = len(metas)
         return JSONResponse(
-            status_code=200,
+            status_code=202,
             content={
-                "task_id": task_id,
-                "status": "Success",
-                "results": results,
-                "total": len(results),
-                "successful": sum(1 for r in results if r.get("status") == "Success"),
-                "failed": sum(1 for r in results if r.get("status") == "Error"),
+                "task_id": str(task_id),
+                "status": "Processing",
+                "progress": f"{current}/{total}",
+                "percent": round((current / total) * 100, 2),
+                "completed": current,
+                "total": total,
             },
         )
+
+    results = [
+        failed_result(meta) if meta["status"] != "SUCCESS" else None for meta in metas
+    ]
+    succeeded = [i for i, meta in enumerate(metas) if meta["status"] == "SUCCESS"]
+    try:
+        loaded = await asyncio.gather(
+            *[result_store.load_result(metas[i]["result"]) for i in succeeded]
+        )
+        for i, result in zip(succeeded, loaded):
+            results[i] = result
+    except BlobNotFoundError:
+        return result_expired_response(task_id)
+    if delete:
+        await result_store.forget(member_ids, metas)
+        await result_store.forget_group(task_id)
+
+    try:
+        content = {
+            "task_id": task_id,
+            "status": "Success",
+            "results": results,
+            "total": len(results),
+            "successful": sum(1 for r in results if r.get("status") != "Error"),
+            "failed": sum(1 for r in results if r.get("status") == "Error"),
+        }
+        if image_delivery == ImageDelivery.zip:
+            content["results"], files = split_images(results, nested=True)
+            return await zip_response(content, files)
+        return ConversionJSONResponse(content)
     except Exception as e:
         logger.error(f"Error retrieving results for task {task_id}: {str(e)}")
         return JSONResponse(
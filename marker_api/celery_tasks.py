@@ -1,11 +1,22 @@
-from celery import Task
+from celery import Task, group
 from marker_api.celery_worker import celery_app
 from marker.convert import convert_single_pdf
 from marker.models import load_all_models
 import io
+import time
 import logging
-from marker_api.utils import process_image_to_base64
-from celery.signals import worker_process_init
+from marker_api.blob_store import get_blob_store
+from marker_api.cache import conversion_key, lookup_result, store_result
+from marker_api.coalesce import release_inflight_task
+from marker_api.fairshare import release_task
+from marker_api.result_storage import (
+    compact_result,
+    delete_result,
+    resolve_result,
+    sweep_expired_blobs,
+)
+from marker_api.utils import normalize_options, render_images
+from celery.signals import task_postrun, task_revoked, worker_process_init
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +31,17 @@ def initialize_models(**kwargs):
         print("Models loaded at worker startup")
 
 
+@task_postrun.connect
+def release_tenant_slot(task_id=None, **kwargs):
+    release_task(celery_app.backend.client, task_id)
+
+
+@task_revoked.connect
+def release_revoked_tenant_slot(request=None, **kwargs):
+    if request is not None:
+        release_task(celery_app.backend.client, request.id)
+
+
 class PDFConversionTask(Task):
     abstract = True
 
@@ -28,28 +50,151 @@ class PDFConversionTask(Task):
 
     def __call__(self, *args, **kwargs):
         # Use the global model_list initialized at worker startup
-        return self.run(*args, **kwargs)
+        result = self.run(*args, **kwargs)
+        sweep_expired_blobs()
+        if self.request.called_directly:
+            # Called from another task, which stores the result itself
+            return result
+        # Large results go to the blob store, the backend only keeps a pointer
+        return compact_result(self.request.id, result)
 
 
 @celery_app.task(
     ignore_result=False, bind=True, base=PDFConversionTask, name="convert_pdf"
 )
-def convert_pdf_to_markdown(self, filename, pdf_content):
+def convert_pdf_to_markdown(
+    self,
+    filename,
+    blob_key,
+    options=None,
+    start_page=None,
+    max_pages=None,
+    cleanup=True,
+    inflight_key=None,
+):
+    entry_time = time.time()
+    key = None
+    try:
+        # Only the blob key travels through the broker, the PDF is fetched here
+        blob_store = get_blob_store()
+        pdf_content = blob_store.get(blob_key)
+        if cleanup:
+            blob_store.delete(blob_key)
+        options = normalize_options(options)
+        key_options = options
+        if start_page is not None or max_pages is not None:
+            # Page windows of the same PDF are cached apart from the whole document
+            key_options = dict(options, start_page=start_page, max_pages=max_pages)
+        key = conversion_key(pdf_content, key_options)
+        return _convert_pdf_to_markdown(
+            filename, pdf_content, options, key, entry_time, start_page, max_pages
+        )
+    finally:
+        # The API sends the key it claimed, released even if the PDF was never read
+        claimed = inflight_key or key
+        if self.request.id and claimed is not None:
+            release_inflight_task(celery_app.backend.client, claimed, self.request.id)
+
+
+def _convert_pdf_to_markdown(
+    filename, pdf_content, options, key, entry_time, start_page, max_pages
+):
+    cached = lookup_result(key, filename)
+    if cached is not None:
+        return cached
+
     pdf_file = io.BytesIO(pdf_content)
-    markdown_text, images, metadata = convert_single_pdf(pdf_file, model_list)
-    image_data = {}
-    for i, (img_filename, image) in enumerate(images.items()):
-        logger.debug(f"Processing image {img_filename}")
-        image_base64 = process_image_to_base64(image, img_filename)
-        image_data[img_filename] = image_base64
-
-    return {
+    markdown_text, images, metadata = convert_single_pdf(
+        pdf_file, model_list, max_pages=max_pages, start_page=start_page
+    )
+    markdown_text, image_data = render_images(markdown_text, images, options)
+
+    result = {
         "filename": filename,
         "markdown": markdown_text,
         "metadata": metadata,
         "images": image_data,
         "status": "ok",
+        "time": time.time() - entry_time,
     }
+    if start_page is not None or max_pages is not None:
+        result["start_page"] = start_page
+        result["max_pages"] = max_pages
+    return store_result(key, result)
+
+
+def _merge_metadata(shard_metadata):
+    """
+    Combine the metadata of page shards: page counts and numeric stats are summed,
+    everything else (toc, languages, filetype) is taken from the first shard.
+    """
+    merged = {}
+    for metadata in shard_metadata:
+        for key, value in (metadata or {}).items():
+            if key not in merged:
+                merged[key] = value
+            elif key == "toc":
+                merged[key] = merged[key] or value
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                if isinstance(merged[key], (int, float)):
+                    merged[key] += value
+            elif isinstance(value, dict) and isinstance(merged[key], dict):
+                merged[key] = _merge_metadata([merged[key], value])
+    return merged
+
+
+@celery_app.task(ignore_result=False, name="delete_blob")
+def delete_blob(blob_key, key=None, task_id=None):
+    """
+    Remove an uploaded PDF, used as an error callback when its tasks fail.
+
+    With `key` and `task_id`, the in-flight claim of the failed task is released
+    too, so identical uploads start a new conversion instead of attaching to it.
+    """
+    if key is not None and task_id is not None:
+        release_inflight_task(celery_app.backend.client, key, task_id)
+    get_blob_store().delete(blob_key)
+
+
+@celery_app.task(
+    ignore_result=False, bind=True, base=PDFConversionTask, name="merge_shards"
+)
+def merge_shards(self, shard_results, filename, key, blob_key):
+    """
+    Chord callback reassembling the page shards of one PDF, in page order.
+
+    The merged document is cached under the whole-document key, the in-flight
+    claim taken by the API is released and the shared upload is removed, as are
+    the stored shard results nobody else reads.
+    """
+    stored_shards = shard_results
+    try:
+        shard_results = sorted(
+            (resolve_result(shard) for shard in shard_results),
+            key=lambda r: r.get("start_page") or 0,
+        )
+        images = {}
+        for shard in shard_results:
+            images.update(shard["images"])
+        metadata = _merge_metadata([shard["metadata"] for shard in shard_results])
+        metadata.pop("custom_metadata", None)
+        result = {
+            "filename": filename,
+            "markdown": "\n\n".join(shard["markdown"] for shard in shard_results),
+            "metadata": metadata,
+            "images": images,
+            "status": "ok",
+            # Shards run side by side, so the slowest one bounds the conversion time
+            "time": max(shard.get("time", 0) for shard in shard_results),
+        }
+        result = store_result(key, result)
+        result["metadata"]["custom_metadata"]["shards"] = len(shard_results)
+        return result
+    finally:
+        release_inflight_task(celery_app.backend.client, key, self.request.id)
+        get_blob_store().delete(blob_key)
+        for shard in stored_shards:
+            delete_result(shard)
 
 
 # @celery_app.task(
@@ -68,20 +213,35 @@ def convert_pdf_to_markdown(self, filename, pdf_content):
 
 
 @celery_app.task(
-    ignore_result=False, bind=True, base=PDFConversionTask, name="process_batch"
+    ignore_result=False, bind=True, base=PDFConversionTask, name="convert_batch_item"
 )
-def process_batch(self, batch_data):
-    results = []
-    total = len(batch_data)
-    for i, (filename, pdf_content) in enumerate(batch_data, start=1):
-        try:
-            result = convert_pdf_to_markdown(filename, pdf_content)
-            results.append(result)
-        except Exception as e:
-            logger.error(f"Error processing {filename}: {str(e)}")
-            results.append({"filename": filename, "status": "Error", "error": str(e)})
-
-        # Update progress
-        self.update_state(state="PROGRESS", meta={"current": i, "total": total})
-
-    return results
+def convert_batch_item(self, filename, blob_key, options=None):
+    try:
+        return convert_pdf_to_markdown(filename, blob_key, options)
+    except Exception as e:
+        logger.error(f"Error processing {filename}: {str(e)}")
+        return {"filename": filename, "status": "Error", "error": str(e)}
+
+
+def process_batch(batch_data, options=None):
+    """
+    Fan a batch out as a group of per-file tasks, so every online worker can take part.
+
+    The group is saved in the result backend, so its progress and results can be
+    looked up by id later with GroupResult.restore.
+
+    Args:
+    batch_data (list): (filename, blob_key, task_id, queue, priority) per uploaded PDF.
+    options (dict): The conversion options.
+
+    Returns:
+    GroupResult: The saved group.
+    """
+    result = group(
+        convert_batch_item.s(filename, blob_key, options).set(
+            task_id=task_id, queue=queue, priority=priority
+        )
+        for filename, blob_key, task_id, queue, priority in batch_data
+    ).apply_async()
+    result.save()
+    return result
@@ -1,12 +1,16 @@
 import os
 from celery import Celery
 from dotenv import load_dotenv
+from kombu import Queue
 import multiprocessing
 
 multiprocessing.set_start_method("spawn")
 
 load_dotenv(".env")
 
+# Imported after loading .env, which may configure it
+from marker_api.result_storage import RESULT_EXPIRES  # noqa: E402
+
 celery_app = Celery(
     "celery_app",
     broker=os.environ.get("REDIS_HOST", "redis://localhost:6379/0"),
@@ -14,6 +18,39 @@ celery_app = Celery(
     include=["marker_api.celery_tasks"],
 )
 
+# Priority lanes: single documents someone is waiting on, and batch work
+INTERACTIVE_QUEUE = "interactive"
+BULK_QUEUE = "bulk"
+DEVICES = ("gpu", "cpu")
+
+
+def device_queue(lane: str, device: str) -> str:
+    """
+    Name of the queue of a lane served by one kind of worker, e.g. "bulk.gpu".
+    """
+    return f"{lane}.{device}"
+
+
+celery_app.conf.update(
+    # Workers started without -Q consume both lanes, for every device
+    task_queues=tuple(
+        Queue(name)
+        for lane in (INTERACTIVE_QUEUE, BULK_QUEUE)
+        for name in (lane, *(device_queue(lane, device) for device in DEVICES))
+    ),
+    task_default_queue=INTERACTIVE_QUEUE,
+    broker_transport_options={
+        # One Redis list per priority level, so the fair-share priorities all count
+        "priority_steps": list(range(10)),
+        # Drain the interactive lane before looking at the bulk one
+        "queue_order_strategy": "priority",
+    },
+    # Only take one task at a time, so priorities apply to everything still queued
+    worker_prefetch_multiplier=1,
+    # Results are fetched soon after they are stored, don't let them pile up in Redis
+    result_expires=RESULT_EXPIRES,
+)
+
 
 @celery_app.task(name="celery.ping")
 def ping():
@@ -0,0 +1,111 @@
+import os
+import copy
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How long a distributed in-flight claim lives if the worker never releases it
+INFLIGHT_TTL = int(os.environ.get("MARKER_API_INFLIGHT_TTL", "600"))
+INFLIGHT_PREFIX = "marker-api:inflight:"
+
+
+class RequestCoalescer:
+    """
+    In-process deduplication of conversions that are running right now.
+
+    Concurrent requests for the same key attach to the first request's future
+    instead of starting their own conversion. Must only be used from the event loop.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def attach(
+        self, key: str, start: Callable[[], asyncio.Future]
+    ) -> Tuple[asyncio.Future, bool]:
+        """
+        Return the in-flight future for `key`, starting it with `start()` if needed.
+
+        `start` is called synchronously, so any admission error it raises reaches
+        the caller before anything is registered.
+
+        Returns:
+        tuple: The future and whether it was already in flight.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            return future, True
+        future = start()
+        self._inflight[key] = future
+
+        def _forget(done):
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+
+        future.add_done_callback(_forget)
+        return future, False
+
+    def is_inflight(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def wait(self, future: asyncio.Future, filename: str, coalesced: bool):
+        """
+        Wait for a shared conversion and return a copy labelled for this upload.
+
+        The future is shielded so one client disconnecting never cancels the
+        conversion other clients are waiting on.
+        """
+        result = await asyncio.shield(future)
+        if not coalesced:
+            return result
+        return coalesced_result(result, filename)
+
+
+def coalesced_result(result: Dict[str, Any], filename: str) -> Dict[str, Any]:
+    """
+    Copy a shared conversion result for another upload of the same document.
+    """
+    result = dict(result)
+    result["filename"] = filename
+    metadata = result.get("metadata")
+    if isinstance(metadata, dict):
+        result["metadata"] = copy.deepcopy(metadata)
+        result["metadata"].setdefault("custom_metadata", {})["coalesced"] = True
+    return result
+
+
+def claim_inflight_task(client, key: str, task_id: str) -> Optional[str]:
+    """
+    Claim `key` for `task_id` in Redis so other API processes can attach to it.
+
+    Args:
+    client (redis.Redis): The Redis client shared with the Celery backend.
+    key (str): The conversion cache key.
+    task_id (str): The id the new task will be started with.
+
+    Returns:
+    str: The id of a task already running for the same key, or None if claimed.
+    """
+    redis_key = f"{INFLIGHT_PREFIX}{key}"
+    if client.set(redis_key, task_id, nx=True, ex=INFLIGHT_TTL):
+        return None
+    existing = client.get(redis_key)
+    if existing is None:
+        # The running task finished between the two calls, claim it again
+        return claim_inflight_task(client, key, task_id)
+    return existing.decode("utf-8") if isinstance(existing, bytes) else existing
+
+
+def release_inflight_task(client, key: str, task_id: str):
+    """
+    Drop the in-flight claim for `key` if it still belongs to `task_id`.
+    """
+    redis_key = f"{INFLIGHT_PREFIX}{key}"
+    try:
+        existing = client.get(redis_key)
+        if existing is not None and existing.decode("utf-8") == task_id:
+            client.delete(redis_key)
+    except Exception as e:
+        logger.warning(f"Failed to release in-flight claim {key}: {str(e)}")
@@ -0,0 +1,162 @@
+import os
+import gzip
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+from starlette.datastructures import Headers, MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings offered to clients, in order of preference (empty disables compression)
+COMPRESSION = os.environ.get("MARKER_API_COMPRESSION", "zstd,br,gzip")
+# Smaller bodies are sent as they are, compressing them saves next to nothing
+COMPRESS_MIN_BYTES = int(os.environ.get("MARKER_API_COMPRESS_MIN_BYTES", "1024"))
+# Larger bodies are compressed on a thread, so the event loop keeps serving
+COMPRESS_THREAD_BYTES = int(
+    os.environ.get("MARKER_API_COMPRESS_THREAD_BYTES", str(64 * 1024))
+)
+
+# Already compressed, or streamed to clients that read them as they come
+SKIPPED_CONTENT_TYPES = (
+    "application/zip",
+    "application/x-ndjson",
+    "text/event-stream",
+    "image/",
+    "video/",
+    "audio/",
+)
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    # Compressor instances are not thread-safe and bodies are compressed on worker
+    # threads, so each call gets its own
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    compressors = {}
+    if zstandard is not None:
+        compressors["zstd"] = _zstd_compress
+    if brotli is not None:
+        compressors["br"] = lambda data: brotli.compress(data, quality=4)
+    compressors["gzip"] = lambda data: gzip.compress(data, compresslevel=5, mtime=0)
+    return compressors
+
+
+COMPRESSORS = _compressors()
+
+
+def choose_encoding(accept_encoding: str, offered: str = COMPRESSION) -> Optional[str]:
+    """
+    Pick the preferred encoding of the server that the client accepts.
+
+    Args:
+    accept_encoding (str): The Accept-Encoding header of the request.
+    offered (str): Comma separated encodings, in order of preference.
+
+    Returns:
+    str: The encoding to use, or None to send the body uncompressed.
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip()] = quality
+    for encoding in (name.strip() for name in offered.split(",")):
+        if encoding not in COMPRESSORS:
+            continue
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with zstd, brotli or gzip, whichever the client prefers.
+
+    Unlike Starlette's GZipMiddleware, bodies above COMPRESS_THREAD_BYTES are
+    compressed off the event loop, and streamed responses (NDJSON, files) and zip
+    archives are passed through untouched.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESS_MIN_BYTES,
+        thread_size: int = COMPRESS_THREAD_BYTES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_size = thread_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or content_type.startswith(
+                    SKIPPED_CONTENT_TYPES
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held back until the body shows whether it is worth compressing
+                    start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            passthrough = True
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streamed or small: sent as is
+                await send(start)
+                await send(message)
+                return
+            compress = COMPRESSORS[encoding]
+            if len(body) >= self.thread_size:
+                compressed = await asyncio.to_thread(compress, body)
+            else:
+                compressed = compress(body)
+            headers = MutableHeaders(raw=list(start["headers"]))
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
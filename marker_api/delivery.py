@@ -0,0 +1,127 @@
+import io
+import os
+import json
+import base64
+import asyncio
+import zipfile
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+from fastapi.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ZIP_MEDIA_TYPE = "application/zip"
+ZIP_BODY_NAME = "result.json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Default number of pages converted and emitted per streamed chunk
+STREAM_PAGES = int(os.environ.get("MARKER_API_STREAM_PAGES", "8"))
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize a response body to JSON, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, ensure_ascii=False, separators=(",", ":"), default=_json_default
+    ).encode("utf-8")
+
+
+class ConversionJSONResponse(JSONResponse):
+    """
+    JSON response for conversion results, serialized in a single orjson pass.
+
+    Returning a response skips FastAPI's response_model round-trip, which would
+    validate the markdown and images we produced ourselves once more, re-encode
+    them with jsonable_encoder and only then dump them with the json module.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def split_images(
+    results: List[Dict[str, Any]], nested: bool = False
+) -> Tuple[List[Dict[str, Any]], Dict[str, bytes]]:
+    """
+    Move the images out of conversion results and replace them with archive paths.
+
+    Args:
+    results (list): Conversion results with base64 encoded images.
+    nested (bool): Prefix paths with the result index, so batch results never collide.
+
+    Returns:
+    tuple: The results referencing images by path, and the raw image bytes per path.
+    """
+    files = {}
+    referenced = []
+    for index, result in enumerate(results):
+        result = dict(result)
+        references = {}
+        for name, image_base64 in (result.get("images") or {}).items():
+            path = f"{index}/images/{name}" if nested else f"images/{name}"
+            files[path] = base64.b64decode(image_base64)
+            references[name] = path
+        result["images"] = references
+        referenced.append(result)
+    return referenced, files
+
+
+def _build_zip(body: Dict[str, Any], files: Dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(
+            ZIP_BODY_NAME, dumps(body), compress_type=zipfile.ZIP_DEFLATED
+        )
+        # Images are already compressed, storing them avoids burning CPU for nothing
+        for path, data in files.items():
+            archive.writestr(path, data, compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+async def zip_response(
+    body: Dict[str, Any], files: Dict[str, bytes], filename: str = "conversion.zip"
+) -> Response:
+    """
+    Build a zip response holding the JSON body as result.json next to the raw images.
+
+    The archive is assembled off the event loop.
+    """
+    content = await asyncio.to_thread(_build_zip, body, files)
+    logger.debug(f"Built {len(content)} byte archive with {len(files)} images")
+    return Response(
+        content=content,
+        media_type=ZIP_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def ndjson_line(event: Dict[str, Any]) -> bytes:
+    """
+    Serialize one streamed event as a newline-delimited JSON line.
+    """
+    return dumps(event) + b"\n"
+
+
+def page_windows(page_count: int, pages_per_chunk: int) -> List[Tuple[int, int]]:
+    """
+    Split a document into consecutive (start_page, max_pages) windows.
+    """
+    return [
+        (start, min(pages_per_chunk, page_count - start))
+        for start in range(0, page_count, pages_per_chunk)
+    ]
@@ -0,0 +1,290 @@
+import os
+import asyncio
+import functools
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+# Torch threads per replica, so replicas don't oversubscribe the cores
+REPLICA_THREADS = int(os.environ.get("MARKER_API_REPLICA_THREADS", "4"))
+
+# The models of the current replica process
+_replica_models = None
+
+
+class QueueFullError(Exception):
+    """
+    Raised when the inference executor cannot accept more conversions.
+    """
+
+
+class InferenceExecutor:
+    """
+    Long-lived executor that runs model inference off the event loop.
+
+    Every job is called with the executor's `model_list` as a keyword argument,
+    so handlers never need to reach for the loaded models themselves.
+
+    Args:
+    model_list: The list of loaded models.
+    max_workers (int): Number of conversions that run at the same time.
+    max_queue (int): Number of conversions allowed to wait for a free worker.
+    """
+
+    def __init__(self, model_list, max_workers: int = 1, max_queue: int = 8):
+        self.model_list = model_list
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = self._create_pool()
+        self._lock = threading.Lock()
+        self._pending = 0
+        logger.info(
+            f"{type(self).__name__} started with {self.max_workers} workers "
+            f"and a queue depth of {self.max_queue}"
+        )
+
+    def _create_pool(self) -> concurrent.futures.Executor:
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="marker-inference"
+        )
+
+    def _job(self, fn, args, kwargs):
+        return functools.partial(fn, *args, model_list=self.model_list, **kwargs)
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of conversions that are either running or waiting to run.
+        """
+        return self._pending
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def check_capacity(self, count: int = 1):
+        """
+        Raise QueueFullError if `count` more conversions would overflow the queue.
+        """
+        if self._pending + count > self.capacity:
+            raise QueueFullError(
+                f"Inference queue is full ({self._pending}/{self.capacity} pending)"
+            )
+
+    def reserve(self, count: int) -> "Reservation":
+        """
+        Reserve up to `count` slots, as many as are free, for one request's jobs.
+
+        Must be called from the event loop.
+
+        Raises:
+        QueueFullError: If no slot is free at all.
+        """
+        with self._lock:
+            free = self.capacity - self._pending
+            if free <= 0:
+                raise QueueFullError(
+                    f"Inference queue is full ({self._pending}/{self.capacity} pending)"
+                )
+            slots = min(max(1, count), free)
+            self._pending += slots
+        return Reservation(self, slots)
+
+    def _release_slots(self, count: int):
+        with self._lock:
+            self._pending -= count
+
+    def submit(self, fn, *args, **kwargs) -> asyncio.Future:
+        """
+        Schedule `fn(*args, model_list=..., **kwargs)` on the inference pool.
+
+        Must be called from the event loop. The slot is held until the job
+        actually finishes, even if the awaiting request is cancelled.
+
+        Returns:
+        asyncio.Future: A future resolving to the return value of `fn`.
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise QueueFullError(
+                    f"Inference queue is full ({self._pending}/{self.capacity} pending)"
+                )
+            self._pending += 1
+        future = self._pool.submit(self._job(fn, args, kwargs))
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a single job on the inference pool and wait for its result.
+        """
+        return await self.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True):
+        logger.info("Shutting down inference executor")
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+class Reservation:
+    """
+    Executor slots held by one request, handed from one of its jobs to the next.
+
+    A request with more jobs than the executor has room for, like a large batch,
+    runs them all this way: each job waits for one of the request's slots rather
+    than being rejected by a full queue.
+
+    Args:
+    executor (InferenceExecutor): The executor the slots were reserved on.
+    slots (int): Number of reserved slots.
+    """
+
+    def __init__(self, executor: InferenceExecutor, slots: int):
+        self.executor = executor
+        self.slots = slots
+        self._loop = asyncio.get_running_loop()
+        self._free = asyncio.Semaphore(slots)
+        self._running = 0
+        self._closed = False
+
+    async def acquire(self):
+        """
+        Wait for a free slot, to be used by `submit` or given back with `release`.
+        """
+        await self._free.acquire()
+
+    def release(self):
+        """
+        Give back a slot taken with `acquire` that ended up not running a job.
+        """
+        self._free.release()
+
+    def submit(self, fn, *args, **kwargs) -> asyncio.Future:
+        """
+        Run a job on a slot taken with `acquire`, freed when the job finishes.
+
+        Returns:
+        asyncio.Future: A future resolving to the return value of `fn`.
+        """
+        self._running += 1
+        future = self.executor._pool.submit(self.executor._job(fn, args, kwargs))
+        future.add_done_callback(self._job_finished)
+        return asyncio.wrap_future(future)
+
+    def _job_finished(self, _future):
+        # Called on the pool's thread
+        try:
+            self._loop.call_soon_threadsafe(self._free_slot)
+        except RuntimeError:
+            # The event loop is gone, and the executor with it
+            pass
+
+    def _free_slot(self):
+        self._running -= 1
+        self._free.release()
+        self._return_slots()
+
+    def close(self):
+        """
+        Hand the slots back to the executor, once the running jobs have finished.
+        """
+        self._closed = True
+        self._return_slots()
+
+    def _return_slots(self):
+        if self._closed and self._running == 0 and self.slots:
+            self.executor._release_slots(self.slots)
+            self.slots = 0
+
+
+def _init_replica(model_list, torch_threads: int):
+    global _replica_models
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    if model_list is None:
+        from marker.models import load_all_models
+
+        model_list = load_all_models()
+    _replica_models = model_list
+    logger.info(f"Model replica ready in process {os.getpid()}")
+
+
+def _run_on_replica(fn, args, kwargs):
+    return fn(*args, model_list=_replica_models, **kwargs)
+
+
+def _replica_ready() -> int:
+    return os.getpid()
+
+
+def replica_start_method() -> str:
+    """
+    Pick how replica processes are started.
+
+    CUDA can't be used in a forked child, so GPU replicas are spawned and load
+    their own models. CPU replicas are forked from a parent that already loaded
+    the models, sharing the weights copy-on-write.
+    """
+    import torch
+
+    return "spawn" if torch.cuda.is_available() else "fork"
+
+
+class ProcessInferenceExecutor(InferenceExecutor):
+    """
+    Inference executor running conversions on N model replica processes.
+
+    Each replica holds its own models and runs one conversion at a time, so
+    throughput scales past the GIL on many-core machines. Jobs and results cross
+    the process boundary over the pool's IPC queues and must be picklable, which
+    holds for the module level conversion functions in marker_api.routes.
+
+    Args:
+    model_list: Models to share copy-on-write with forked replicas, or None to
+    have every replica load its own.
+    replicas (int): Number of replica processes.
+    max_queue (int): Number of conversions allowed to wait for a free replica.
+    start_method (str): "fork" or "spawn", see replica_start_method.
+    """
+
+    def __init__(
+        self,
+        model_list=None,
+        replicas: int = 1,
+        max_queue: int = 8,
+        start_method: str = "spawn",
+    ):
+        if start_method != "fork":
+            # Models can't be pickled into spawned replicas, they load their own
+            model_list = None
+        self.start_method = start_method
+        super().__init__(model_list, max_workers=replicas, max_queue=max_queue)
+
+    def _create_pool(self) -> concurrent.futures.Executor:
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_replica,
+            initargs=(self.model_list, REPLICA_THREADS),
+        )
+
+    def _job(self, fn, args, kwargs):
+        return functools.partial(_run_on_replica, fn, args, kwargs)
+
+    def warm_up(self):
+        """
+        Start the replica processes before the first request needs them.
+
+        Replicas load their models on start, so this also keeps model loading
+        out of the first requests' latency.
+        """
+        futures = [self._pool.submit(_replica_ready) for _ in range(self.max_workers)]
+        pids = {future.result() for future in futures}
+        logger.info(f"Model replicas answering from {len(pids)} processes")
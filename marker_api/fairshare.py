@@ -0,0 +1,95 @@
+import os
+import hashlib
+import logging
+from typing import List, Optional
+from marker_api.celery_worker import BULK_QUEUE, INTERACTIVE_QUEUE
+
+logger = logging.getLogger(__name__)
+
+# Outstanding tasks a tenant may have before its next tasks drop one priority level
+FAIR_SHARE_STEP = int(os.environ.get("MARKER_API_FAIR_SHARE_STEP", "4"))
+# Safety net for counters of tasks whose completion was never recorded
+TENANT_TTL = int(os.environ.get("MARKER_API_TENANT_TTL", "3600"))
+
+# With the Redis broker, 0 is the highest priority and 9 the lowest
+PRIORITY_LEVELS = 10
+# Levels of each lane. The Redis transport polls every queue at one priority level
+# before moving to the next, so the lanes get disjoint bands: interactive tasks
+# always come before bulk ones, and fair share only orders tasks within a lane
+LANE_PRIORITIES = {
+    INTERACTIVE_QUEUE: range(0, PRIORITY_LEVELS // 2),
+    BULK_QUEUE: range(PRIORITY_LEVELS // 2, PRIORITY_LEVELS),
+}
+ANONYMOUS_TENANT = "anonymous"
+TENANT_PREFIX = "marker-api:tenant:"
+TASK_TENANT_PREFIX = "marker-api:task-tenant:"
+
+# Drops the task's tenant mapping and gives its slot back, in one round trip
+_RELEASE_SCRIPT = """
+local tenant = redis.call('GET', KEYS[1])
+if tenant then
+    redis.call('DEL', KEYS[1])
+    local counter = ARGV[1] .. tenant
+    if redis.call('DECR', counter) <= 0 then
+        redis.call('DEL', counter)
+    end
+end
+return tenant
+"""
+
+
+def tenant_id(api_key: Optional[str]) -> str:
+    """
+    Derive the tenant from an API key, without keeping the key itself in Redis.
+    """
+    if not api_key:
+        return ANONYMOUS_TENANT
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def schedule_tasks(
+    client, tenant: str, task_ids: List[str], lane: str = INTERACTIVE_QUEUE
+) -> List[int]:
+    """
+    Count tasks against their tenant and pick the priority each is sent with.
+
+    The more tasks a tenant already has outstanding in a lane, the lower the
+    priority of its next ones there, so a large batch drains behind everyone
+    else's fresh requests instead of monopolizing the workers. Tasks are counted
+    per lane, so bulk work never demotes a tenant's interactive requests.
+
+    Args:
+    client: A Redis client.
+    tenant (str): The tenant submitting the tasks.
+    task_ids (list): Ids the tasks will be sent with.
+    lane (str): The lane the tasks are sent to, INTERACTIVE_QUEUE or BULK_QUEUE.
+
+    Returns:
+    list: The priority of each task, in the order of `task_ids`.
+    """
+    levels = LANE_PRIORITIES[lane]
+    # The task mapping holds the lane too, so releasing finds the right counter
+    owner = f"{lane}:{tenant}"
+    counter = f"{TENANT_PREFIX}{owner}"
+    pipe = client.pipeline()
+    pipe.incrby(counter, len(task_ids))
+    pipe.expire(counter, TENANT_TTL)
+    for task_id in task_ids:
+        pipe.set(f"{TASK_TENANT_PREFIX}{task_id}", owner, ex=TENANT_TTL)
+    outstanding = pipe.execute()[0] - len(task_ids)
+    return [
+        levels[min(len(levels) - 1, (outstanding + index) // FAIR_SHARE_STEP)]
+        for index in range(len(task_ids))
+    ]
+
+
+def release_task(client, task_id: str):
+    """
+    Give the slot of a finished or revoked task back to its tenant.
+
+    Safe to call for any task: ids that were never scheduled are ignored.
+    """
+    try:
+        client.eval(_RELEASE_SCRIPT, 1, f"{TASK_TENANT_PREFIX}{task_id}", TENANT_PREFIX)
+    except Exception as e:
+        logger.warning(f"Failed to release tenant slot of {task_id}: {str(e)}")
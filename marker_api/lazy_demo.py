@@ -0,0 +1,99 @@
+import os
+import asyncio
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Serve the Gradio demo UI at / (off by default: gradio is slow to import and build)
+DEMO = os.environ.get("MARKER_API_DEMO", "false").lower() in ("1", "true", "yes")
+
+
+class LazyASGIApp:
+    """
+    ASGI app built by `factory` on its first request, instead of at import.
+
+    Mounted apps never see the lifespan of the app they are mounted on, so the
+    built app's own lifespan is started here, before it serves its first request,
+    and stopped with `close`.
+    """
+
+    def __init__(self, factory: Callable):
+        self.factory = factory
+        self._app = None
+        self._lock = asyncio.Lock()
+        self._lifespan: Optional[asyncio.Task] = None
+        self._shutdown = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        app = await self._get_app()
+        await app(scope, receive, send)
+
+    async def _get_app(self):
+        if self._app is None:
+            async with self._lock:
+                if self._app is None:
+                    # Building the app imports its packages, keep the loop serving
+                    app = await asyncio.to_thread(self.factory)
+                    await self._start(app)
+                    self._app = app
+        return self._app
+
+    async def _start(self, app):
+        started = asyncio.get_running_loop().create_future()
+        startup_sent = False
+
+        async def receive():
+            nonlocal startup_sent
+            if not startup_sent:
+                startup_sent = True
+                return {"type": "lifespan.startup"}
+            await self._shutdown.wait()
+            return {"type": "lifespan.shutdown"}
+
+        async def send(message):
+            if started.done():
+                return
+            if message["type"] == "lifespan.startup.complete":
+                started.set_result(None)
+            elif message["type"] == "lifespan.startup.failed":
+                started.set_exception(RuntimeError(message.get("message", "")))
+
+        async def run():
+            scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+            try:
+                await app(scope, receive, send)
+            finally:
+                if not started.done():
+                    # Apps without lifespan support just return
+                    started.set_result(None)
+
+        self._lifespan = asyncio.create_task(run())
+        await started
+
+    async def close(self):
+        if self._lifespan is not None:
+            self._shutdown.set()
+            await self._lifespan
+            self._lifespan = None
+
+
+def create_demo_app():
+    import gradio as gr
+    from fastapi import FastAPI
+    from marker_api.demo import build_demo_ui
+
+    logger.info("Building the demo UI")
+    return gr.mount_gradio_app(FastAPI(), build_demo_ui(), path="")
+
+
+demo_app = LazyASGIApp(create_demo_app)
+
+
+def mount_demo(app):
+    """
+    Serve the demo UI at the root of `app`.
+
+    The mount matches every path, so call this after every API route is added.
+    """
+    app.mount("/", demo_app)
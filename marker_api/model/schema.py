@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Type, Union, Any
+from datetime import datetime
 from enum import Enum
 
 
@@ -9,12 +10,46 @@ class ServerType(str, Enum):
     distributed = "distributed"
 
 
+class ImageDelivery(str, Enum):
+    # Images embedded as base64 strings in the JSON body
+    base64 = "base64"
+    # A zip archive with the JSON body as result.json and the raw images beside it
+    zip = "zip"
+
+
+class ImageFormat(str, Enum):
+    png = "png"
+    jpeg = "jpeg"
+    webp = "webp"
+
+
+class ConversionOptions(BaseModel):
+    extract_images: bool = Field(
+        True, description="Return the images extracted from the PDF"
+    )
+    image_format: ImageFormat = Field(
+        ImageFormat.png, description="Format the extracted images are encoded in"
+    )
+    image_quality: int = Field(
+        85, ge=1, le=100, description="Quality of jpeg and webp images"
+    )
+    image_max_size: Optional[int] = Field(
+        None, ge=1, description="Downscale images so no side exceeds this many pixels"
+    )
+
+
 class HealthResponse(BaseModel):
     message: str
     type: ServerType
     workers: Optional[int] = Field(
         None, description="Number of workers (only for distributed type)"
     )
+    concurrency: Optional[int] = Field(
+        None, description="Total worker processes (only for distributed type)"
+    )
+    queues: Optional[Dict[str, int]] = Field(
+        None, description="Messages waiting per queue (only for distributed type)"
+    )
 
     class Config:
         @staticmethod
@@ -56,9 +91,24 @@ class ConversionResponse(BaseModel):
     result: Optional[PDFConversionResult] = None
 
 
+class ConversionResultsResponse(BaseModel):
+    status: str
+    results: List[PDFConversionResult]
+
+
 class CeleryTaskResponse(BaseModel):
     task_id: str
     status: str
+    queue: Optional[str] = Field(None, description="Queue the task was sent to")
+    priority: Optional[int] = Field(
+        None, description="Priority of the task, 0 being the highest"
+    )
+    estimated_wait: Optional[float] = Field(
+        None, description="Estimated seconds before the task starts"
+    )
+    estimated_start: Optional[datetime] = Field(
+        None, description="Estimated time the task starts"
+    )
 
 
 class CeleryResultResponse(BaseModel):
@@ -70,6 +120,19 @@ class CeleryResultResponse(BaseModel):
 class BatchConversionResponse(BaseModel):
     task_id: str
     status: str
+    total: Optional[int] = None
+    queue: Optional[str] = Field(
+        None, description="Queue the first task was sent to"
+    )
+    priority: Optional[int] = Field(
+        None, description="Priority of the first task, 0 being the highest"
+    )
+    estimated_wait: Optional[float] = Field(
+        None, description="Estimated seconds before the first task starts"
+    )
+    estimated_start: Optional[datetime] = Field(
+        None, description="Estimated time the first task starts"
+    )
 
 
 class BatchResultResponse(BaseModel):
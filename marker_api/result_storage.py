@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import zlib
+import logging
+import threading
+from typing import Any, Tuple
+from marker_api.blob_store import (
+    UPLOAD_EXPIRES,
+    UPLOAD_PREFIX,
+    BlobNotFoundError,
+    get_blob_store,
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Results whose JSON is larger than this are kept in the blob store, Redis only
+# holds a pointer to them (0 keeps every result in Redis)
+RESULT_INLINE_BYTES = int(os.environ.get("MARKER_API_RESULT_INLINE_BYTES", "65536"))
+# Seconds results are kept, both in the Celery backend and in the blob store
+RESULT_EXPIRES = int(os.environ.get("MARKER_API_RESULT_EXPIRES", "3600"))
+RESULT_COMPRESSION_LEVEL = int(
+    os.environ.get("MARKER_API_RESULT_COMPRESSION_LEVEL", "3")
+)
+
+RESULT_PREFIX = "results"
+RESULT_REF = "result_ref"
+# Left out of the pointer; everything else stays readable without the payload
+PAYLOAD_FIELDS = ("markdown", "images")
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+def compress(data: bytes) -> Tuple[bytes, str]:
+    """
+    Compress a payload with zstd, or zlib when zstandard is not installed.
+
+    Returns:
+    tuple: The compressed bytes and the name of the encoding.
+    """
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=RESULT_COMPRESSION_LEVEL)
+        return compressor.compress(data), "zstd"
+    return zlib.compress(data, min(RESULT_COMPRESSION_LEVEL, 9)), "zlib"
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read this result")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if encoding == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown result encoding: {encoding}")
+
+
+def is_result_ref(result: Any) -> bool:
+    return isinstance(result, dict) and RESULT_REF in result
+
+
+def compact_result(task_id: str, result: Any) -> Any:
+    """
+    Move the payload of a large task result to the blob store.
+
+    Args:
+    task_id (str): The task the result belongs to, which names the blob.
+    result: The value returned by the task.
+
+    Returns:
+    The result itself if it is small, otherwise a pointer keeping every field of
+    the result except the markdown and images.
+    """
+    if RESULT_INLINE_BYTES <= 0 or not isinstance(result, dict):
+        return result
+    data = json.dumps(result).encode("utf-8")
+    if len(data) <= RESULT_INLINE_BYTES:
+        return result
+    payload, encoding = compress(data)
+    key = get_blob_store().put(payload, f"{RESULT_PREFIX}/{task_id}.json.{encoding}")
+    logger.debug(f"Stored result of {task_id}: {len(data)} bytes as {len(payload)}")
+    pointer = {k: v for k, v in result.items() if k not in PAYLOAD_FIELDS}
+    pointer[RESULT_REF] = {"key": key, "encoding": encoding, "size": len(data)}
+    return pointer
+
+
+def resolve_result(result: Any) -> Any:
+    """
+    Load the full result behind a pointer made by `compact_result`.
+
+    Anything that is not a pointer is returned unchanged. This reads the blob
+    store, so call it off the event loop.
+
+    Raises:
+    BlobNotFoundError: If the payload expired or was deleted.
+    """
+    if not is_result_ref(result):
+        return result
+    ref = result[RESULT_REF]
+    data = decompress(get_blob_store().get(ref["key"]), ref["encoding"])
+    return json.loads(data)
+
+
+def delete_result(result: Any):
+    """
+    Remove the payload behind a pointer, if `result` is one.
+    """
+    if is_result_ref(result):
+        try:
+            get_blob_store().delete(result[RESULT_REF]["key"])
+        except BlobNotFoundError:
+            pass
+
+
+def _sweep():
+    blob_store = get_blob_store()
+    expiries = ((RESULT_PREFIX, RESULT_EXPIRES), (UPLOAD_PREFIX, UPLOAD_EXPIRES))
+    for prefix, seconds in expiries:
+        if seconds <= 0:
+            continue
+        try:
+            removed = blob_store.delete_older_than(prefix, seconds)
+            if removed:
+                logger.info(f"Removed {removed} expired {prefix} from the blob store")
+        except Exception as e:
+            logger.warning(f"Failed to remove expired {prefix}: {str(e)}")
+
+
+def sweep_expired_blobs():
+    """
+    Remove results older than RESULT_EXPIRES and uploads older than UPLOAD_EXPIRES,
+    at most a few times per expiry period.
+
+    Redis expires the result pointers on its own; the payloads, and the uploads of
+    tasks that never ran or failed before removing them, are swept here, in the
+    background, by whichever worker process runs tasks.
+    """
+    global _last_sweep
+    expiries = [seconds for seconds in (RESULT_EXPIRES, UPLOAD_EXPIRES) if seconds > 0]
+    if not expiries:
+        return
+    with _sweep_lock:
+        now = time.monotonic()
+        if _last_sweep and now - _last_sweep < max(60, min(expiries) / 4):
+            return
+        _last_sweep = now
+    threading.Thread(target=_sweep, name="blob-sweep", daemon=True).start()
@@ -1,8 +1,8 @@
-import os
 import time
-import base64
+from typing import Union
 from marker.convert import convert_single_pdf
 from marker.logger import configure_logging
+from marker_api.utils import normalize_options, render_images
 import logging
 
 # Initialize logging
@@ -11,13 +11,15 @@ logger = logging.getLogger(__name__)
 
 
 # Function to parse PDF and return markdown, metadata, and image data
-def parse_pdf_and_return_markdown(pdf_file: bytes, extract_images: bool, model_list):
+def parse_pdf_and_return_markdown(
+    pdf_file: Union[bytes, str], options: dict, model_list
+):
     """
     Function to parse a PDF and extract text and images.
 
     Args:
-    pdf_file (bytes): The content of the PDF file.
-    extract_images (bool): Whether to extract images or not.
+    pdf_file (bytes or str): The content of the PDF file, or its path.
+    options (dict): Conversion options, including whether and how to return images.
 
     Returns
     tuple: A tuple containing the full text, metadata, and image data (if extracted).
@@ -25,45 +27,36 @@ def parse_pdf_and_return_markdown(pdf_file: bytes, extract_images: bool, model_l
     logger.debug("Parsing PDF file")
     full_text, images, out_meta = convert_single_pdf(pdf_file, model_list)
     logger.debug(f"Images extracted: {list(images.keys())}")
-    image_data = {}
-    if extract_images:
-        for i, (filename, image) in enumerate(images.items()):
-            logger.debug(f"Processing image {filename}")
-
-            # Save image as PNG
-            image.save(filename, "PNG")
-
-            # Read the saved image file as bytes
-            with open(filename, "rb") as f:
-                image_bytes = f.read()
-
-            # Convert image to base64
-            image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-            image_data[f"{filename}"] = image_base64
-
-            # Remove the temporary image file
-            os.remove(filename)
+    # Encode in memory, so concurrent requests never share a file on disk
+    full_text, image_data = render_images(full_text, images, options)
 
     return full_text, out_meta, image_data
 
 
 # Function to process a single PDF file
-def process_pdf_file(file_content: bytes, filename: str, model_list):
+def process_pdf_file(
+    file_content: Union[bytes, str],
+    filename: str,
+    model_list,
+    options: dict = None,
+):
     """
-    Function to process a single PDF file.
+    Function to process a single PDF file. Results are cached by the caller.
 
     Args:
-    file_content (bytes): The content of the PDF file.
+    file_content (bytes or str): The content of the PDF file, or its path.
     filename (str): The name of the PDF file.
     model_list: The list of loaded models.
+    options (dict): The conversion options, see ConversionOptions.
 
     Returns:
     dict: A dictionary containing the filename, markdown text, metadata, image data, status, and processing time.
     """
+    options = normalize_options(options)
     entry_time = time.time()
     logger.info(f"Entry time for {filename}: {entry_time}")
     markdown_text, metadata, image_data = parse_pdf_and_return_markdown(
-        file_content, extract_images=True, model_list=model_list
+        file_content, options=options, model_list=model_list
     )
     completion_time = time.time()
     logger.info(f"Model processes complete time for {filename}: {completion_time}")
@@ -76,3 +69,44 @@ def process_pdf_file(file_content: bytes, filename: str, model_list):
         "status": "ok",
         "time": time_difference,
     }
+
+
+# Function to process a window of pages of a PDF file
+def process_pdf_pages(
+    file_content: Union[bytes, str],
+    filename: str,
+    start_page: int,
+    max_pages: int,
+    model_list,
+    options: dict = None,
+):
+    """
+    Function to convert a range of pages of a PDF file, used by streaming endpoints.
+
+    Args:
+    file_content (bytes or str): The content of the PDF file, or its path.
+    filename (str): The name of the PDF file.
+    start_page (int): Index of the first page to convert.
+    max_pages (int): Number of pages to convert.
+    model_list: The list of loaded models.
+    options (dict): The conversion options, see ConversionOptions.
+
+    Returns:
+    dict: The page range with its markdown text, metadata and image data.
+    """
+    entry_time = time.time()
+    options = normalize_options(options)
+    markdown_text, images, metadata = convert_single_pdf(
+        file_content, model_list, max_pages=max_pages, start_page=start_page
+    )
+    markdown_text, image_data = render_images(markdown_text, images, options)
+    return {
+        "filename": filename,
+        "start_page": start_page,
+        "max_pages": max_pages,
+        "markdown": markdown_text,
+        "metadata": metadata,
+        "images": image_data,
+        "status": "ok",
+        "time": time.time() - entry_time,
+    }
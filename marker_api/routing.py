@@ -0,0 +1,119 @@
+import os
+import logging
+from typing import Optional
+import pypdfium2 as pdfium
+from marker_api.celery_worker import device_queue
+from marker_api.workers import WorkerRegistry
+
+logger = logging.getLogger(__name__)
+
+# Route documents to "<lane>.cpu" / "<lane>.gpu" queues by estimated cost
+DEVICE_ROUTING = os.environ.get("MARKER_API_DEVICE_ROUTING", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Documents at or above this cost, in text-page equivalents, go to GPU workers
+GPU_COST_THRESHOLD = float(os.environ.get("MARKER_API_GPU_COST_THRESHOLD", "20"))
+# Cost of a page that needs OCR, relative to a page with a text layer
+OCR_PAGE_COST = float(os.environ.get("MARKER_API_OCR_PAGE_COST", "4"))
+# Pages sampled for a text layer
+COST_SAMPLE_PAGES = int(os.environ.get("MARKER_API_COST_SAMPLE_PAGES", "5"))
+# Pages with fewer characters in their text layer are counted as scanned
+MIN_TEXT_CHARS = int(os.environ.get("MARKER_API_MIN_TEXT_CHARS", "100"))
+
+
+class DocumentCost:
+    """
+    Cheap pre-inference estimate of how expensive a PDF is to convert.
+    """
+
+    def __init__(self, pages: int, scanned_ratio: float):
+        self.pages = pages
+        self.scanned_ratio = scanned_ratio
+
+    @property
+    def cost(self) -> float:
+        """
+        The estimated cost in text-page equivalents.
+        """
+        return self.pages * (1 + (OCR_PAGE_COST - 1) * self.scanned_ratio)
+
+
+def estimate_cost(pdf) -> DocumentCost:
+    """
+    Read the page count and sample the text layer of a PDF, without running any model.
+
+    Args:
+    pdf: The PDF content as bytes, a file path or a file object.
+
+    Returns:
+    DocumentCost: The page count and share of sampled pages without a text layer.
+    """
+    doc = pdfium.PdfDocument(pdf)
+    try:
+        pages = len(doc)
+        if pages == 0:
+            return DocumentCost(0, 0.0)
+        samples = min(COST_SAMPLE_PAGES, pages)
+        # Spread the samples over the document, scans are often just the appendix
+        indexes = sorted({index * pages // samples for index in range(samples)})
+        scanned = 0
+        for index in indexes:
+            page = doc[index]
+            textpage = page.get_textpage()
+            try:
+                if textpage.count_chars() < MIN_TEXT_CHARS:
+                    scanned += 1
+            finally:
+                textpage.close()
+                page.close()
+        return DocumentCost(pages, scanned / len(indexes))
+    finally:
+        doc.close()
+
+
+class DeviceRouter:
+    """
+    Picks the queue of a task: cheap documents for CPU workers, OCR-heavy or long
+    ones for GPU workers.
+
+    Falls back to the other device when no live worker consumes the preferred
+    queue, and to the plain lane queue when neither is consumed.
+    """
+
+    def __init__(
+        self,
+        registry: WorkerRegistry,
+        enabled: bool = DEVICE_ROUTING,
+        threshold: float = GPU_COST_THRESHOLD,
+    ):
+        self.registry = registry
+        self.enabled = enabled
+        self.threshold = threshold
+
+    def route(self, lane: str, cost: Optional[DocumentCost]) -> str:
+        """
+        Args:
+        lane (str): The priority lane of the task.
+        cost (DocumentCost): The estimated cost, or None if it could not be read.
+
+        Returns:
+        str: The queue to send the task to.
+        """
+        if not self.enabled or cost is None:
+            return lane
+        device = "gpu" if cost.cost >= self.threshold else "cpu"
+        consumed = {
+            queue
+            for worker in self.registry.snapshot.workers.values()
+            for queue in worker["queues"]
+        }
+        if not consumed:
+            # No snapshot yet, trust the estimate
+            return device_queue(lane, device)
+        for candidate in (device, "cpu" if device == "gpu" else "gpu"):
+            queue = device_queue(lane, candidate)
+            if queue in consumed:
+                return queue
+        return lane
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from marker_api.async_results import (
+    TASK_KEY_PREFIX,
+    AsyncResultStore,
+    decode_task_meta,
+    is_ready,
+)
+from marker_api.blob_store import BlobNotFoundError
+
+logger = logging.getLogger(__name__)
+
+
+class TaskFailedError(Exception):
+    """
+    Raised when a waited-on task finished in a failure state.
+    """
+
+    def __init__(self, task_id: str, meta: Dict[str, Any]):
+        self.task_id = task_id
+        self.meta = meta
+        super().__init__(f"Task {task_id} {meta.get('status')}: {meta.get('result')}")
+
+
+class TaskCompletionListener:
+    """
+    Wakes requests waiting on Celery tasks the moment their result is stored.
+
+    The Redis backend publishes every state change on a channel named after the
+    result key. A single pattern subscription receives them all, so waiting
+    costs nothing per request: no polling, no per-task subscription. Each waiter
+    also reads the stored result once after registering, so results published
+    before the wait started are not missed.
+
+    `on_complete` is called with the meta of every finished task published,
+    whether or not anyone is waiting on it.
+    """
+
+    def __init__(
+        self,
+        result_store: AsyncResultStore,
+        on_complete: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.result_store = result_store
+        self.on_complete = on_complete
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        backoff = 1
+        while True:
+            # Closed on every reconnect, or each attempt keeps a pooled connection
+            pubsub = self.result_store.client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{TASK_KEY_PREFIX}*")
+                logger.info("Listening for Celery task completions")
+                backoff = 1
+                # Anything that finished while we were disconnected was not published
+                await self._recheck_waiters()
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    meta = decode_task_meta(message["data"])
+                    self._dispatch(channel[len(TASK_KEY_PREFIX) :], meta)
+                    if self.on_complete is not None and is_ready(meta):
+                        try:
+                            self.on_complete(meta)
+                        except Exception as e:
+                            logger.warning(f"Task completion hook failed: {str(e)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Task completion listener disconnected: {str(e)}")
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _dispatch(self, task_id: str, meta: Optional[Dict[str, Any]]):
+        if not is_ready(meta):
+            return
+        for future in self._waiters.pop(task_id, []):
+            if not future.done():
+                future.set_result(meta)
+
+    async def _recheck_waiters(self):
+        task_ids = list(self._waiters)
+        if not task_ids:
+            return
+        metas = await self.result_store.get_many(task_ids)
+        for task_id, meta in zip(task_ids, metas):
+            self._dispatch(task_id, meta)
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None) -> Any:
+        """
+        Wait until a task finishes and return its full result.
+
+        Raises:
+        TaskFailedError: If the task failed or was revoked.
+        BlobNotFoundError: If the result was already deleted, e.g. by another
+        request that attached to the same task and fetched it with delete=true.
+        asyncio.TimeoutError: If the task did not finish within `timeout` seconds.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(task_id, []).append(future)
+        try:
+            meta = await self.result_store.get_meta(task_id)
+            if meta is None and await self.result_store.is_forgotten(task_id):
+                raise BlobNotFoundError(task_id)
+            self._dispatch(task_id, meta)
+            meta = await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self._waiters.get(task_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[task_id]
+        if meta["status"] != "SUCCESS":
+            raise TaskFailedError(task_id, meta)
+        return await self.result_store.load_result(meta["result"])
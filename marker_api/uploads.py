@@ -0,0 +1,168 @@
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import List, Optional
+from fastapi import Request, UploadFile
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Largest single uploaded file, in bytes
+MAX_FILE_BYTES = int(os.environ.get("MARKER_API_MAX_FILE_BYTES", str(200 * 1024**2)))
+# Largest request body, every file of a batch included
+MAX_REQUEST_BYTES = int(
+    os.environ.get("MARKER_API_MAX_REQUEST_BYTES", str(2 * 1024**3))
+)
+# Uploads are copied to disk in chunks of this size, never read whole into memory
+UPLOAD_CHUNK_BYTES = int(os.environ.get("MARKER_API_UPLOAD_CHUNK_BYTES", str(1024**2)))
+UPLOAD_DIR = os.environ.get("MARKER_API_UPLOAD_DIR") or tempfile.gettempdir()
+
+
+class UploadTooLargeError(Exception):
+    """
+    Raised when an upload or the request carrying it exceeds its size limit.
+    """
+
+    def __init__(self, what: str, limit: int):
+        self.limit = limit
+        super().__init__(f"{what} exceeds the limit of {limit} bytes")
+
+
+def remove_file(path: Optional[str]):
+    if path is None:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SpooledUpload:
+    """
+    An uploaded PDF copied to a temporary file, with its SHA-256 digest.
+
+    Conversions are handed the path, so the API process never holds the content.
+    Whoever ends up owning the file removes it with `close`.
+    """
+
+    def __init__(self, filename: str, path: str, digest: str, size: int):
+        self.filename = filename
+        self.path = path
+        self.digest = digest
+        self.size = size
+
+    def detach(self) -> str:
+        """
+        Hand the file over to a conversion, which now has to remove it.
+
+        Returns:
+        str: The path of the file. Closing this upload no longer removes it.
+        """
+        path, self.path = self.path, None
+        return path
+
+    def close(self):
+        remove_file(self.path)
+        self.path = None
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    digest.update(chunk)
+    f.write(chunk)
+
+
+async def spool_upload(
+    upload: UploadFile, limit: int = MAX_FILE_BYTES
+) -> SpooledUpload:
+    """
+    Copy an upload to a temporary file chunk by chunk, hashing it on the way.
+
+    Args:
+    upload (UploadFile): The uploaded file.
+    limit (int): Largest size accepted for this file.
+
+    Returns:
+    SpooledUpload: The spooled file.
+
+    Raises:
+    UploadTooLargeError: If the upload is larger than `limit`.
+    """
+    fd, path = tempfile.mkstemp(prefix="marker-api-", suffix=".pdf", dir=UPLOAD_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLargeError(upload.filename or "Upload", limit)
+                await asyncio.to_thread(_write_chunk, f, digest, chunk)
+    except BaseException:
+        remove_file(path)
+        raise
+    finally:
+        await upload.close()
+    return SpooledUpload(upload.filename, path, digest.hexdigest(), size)
+
+
+async def spool_uploads(uploads: List[UploadFile]) -> List[SpooledUpload]:
+    """
+    Spool the files of a batch one after the other, within the request limit.
+
+    Raises:
+    UploadTooLargeError: If a file or the batch as a whole is too large. Files
+    spooled so far are removed.
+    """
+    spooled = []
+    remaining = MAX_REQUEST_BYTES
+    try:
+        for upload in uploads:
+            if remaining < MAX_FILE_BYTES:
+                try:
+                    spooled.append(await spool_upload(upload, remaining))
+                except UploadTooLargeError:
+                    raise UploadTooLargeError("Request", MAX_REQUEST_BYTES)
+            else:
+                spooled.append(await spool_upload(upload))
+            remaining -= spooled[-1].size
+    except BaseException:
+        for upload in spooled:
+            upload.close()
+        raise
+    return spooled
+
+
+async def upload_too_large_handler(request: Request, exc: UploadTooLargeError):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+class UploadLimitMiddleware:
+    """
+    Reject requests whose declared body size is over the limit before it is read.
+
+    Chunked requests carry no length, their files are checked while spooling.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = dict(scope["headers"])
+            length = headers.get(b"content-length")
+            if length is not None and length.isdigit() and int(length) > self.max_bytes:
+                response = JSONResponse(
+                    status_code=413,
+                    content={
+                        "detail": str(UploadTooLargeError("Request", self.max_bytes))
+                    },
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -1,35 +1,89 @@
+import os
 import base64
 import torch
 from enum import Enum
 import pynvml
+import pypdfium2 as pdfium
 import io
+import threading
+import concurrent.futures
 from art import text2art
 from PIL import Image
+from typing import Any, Dict, Optional, Tuple
+from marker_api.model.schema import ConversionOptions, ImageFormat
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Small pool shared by every request; PIL releases the GIL while compressing
+IMAGE_WORKERS = int(
+    os.environ.get("MARKER_API_IMAGE_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+
+# PIL format name and file extension for every supported output format
+IMAGE_FORMATS = {
+    ImageFormat.png.value: ("PNG", ".png"),
+    ImageFormat.jpeg.value: ("JPEG", ".jpg"),
+    ImageFormat.webp.value: ("WEBP", ".webp"),
+}
+
 
 class DeviceType(Enum):
     CPU = "cpu"
     GPU = "gpu"
 
 
-def process_image_to_base64(image: Image.Image, filename: str) -> str:
+def normalize_options(options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Fill in the defaults of a conversion options dict and make it JSON serializable.
+
+    Image settings are dropped when images are not extracted, so they never split
+    the result cache.
+    """
+    normalized = ConversionOptions(**(options or {})).model_dump(mode="json")
+    if not normalized["extract_images"]:
+        return {"extract_images": False}
+    return normalized
+
+
+def process_image_to_base64(
+    image: Image.Image,
+    filename: str,
+    image_format: str = ImageFormat.png.value,
+    quality: int = 85,
+    max_size: Optional[int] = None,
+) -> str:
     """
     Process an image and convert it to base64.
 
     Args:
     image (PIL.Image.Image): The image to process.
-    filename (str): The filename to use for the temporary file.
+    filename (str): The filename of the image, used for logging.
+    image_format (str): Output format, one of png, jpeg or webp.
+    quality (int): Quality used by the lossy formats.
+    max_size (int): Downscale so that neither side exceeds this many pixels.
 
     Returns:
     str: The base64 encoded string of the image.
     """
     try:
-        # Save image as PNG in memory
+        if max_size and max(image.size) > max_size:
+            image = image.copy()
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+        pil_format, _ = IMAGE_FORMATS[image_format]
+        save_kwargs = {}
+        if pil_format != "PNG":
+            save_kwargs["quality"] = quality
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+        # Save image in memory
         img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format="PNG")
+        image.save(img_byte_arr, format=pil_format, **save_kwargs)
         img_byte_arr = img_byte_arr.getvalue()
 
         # Convert image to base64
@@ -41,12 +95,154 @@ def process_image_to_base64(image: Image.Image, filename: str) -> str:
         return ""
 
 
+def _get_image_pool() -> concurrent.futures.ThreadPoolExecutor:
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            _image_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=IMAGE_WORKERS, thread_name_prefix="marker-images"
+            )
+        return _image_pool
+
+
+def encode_images(
+    images: Dict[str, Image.Image], options: Optional[Dict[str, Any]] = None
+) -> Dict[str, str]:
+    """
+    Encode extracted images to base64 in memory, in parallel on a small pool.
+
+    Args:
+    images (dict): Mapping of image filenames to PIL images.
+    options (dict): Conversion options holding the image format, quality and max size.
+
+    Returns:
+    dict: Mapping of image filenames to base64 encoded images, in the original order.
+    """
+    if not images:
+        return {}
+    options = normalize_options(options)
+    encode_kwargs = {
+        "image_format": options["image_format"],
+        "quality": options["image_quality"],
+        "max_size": options["image_max_size"],
+    }
+    if len(images) == 1 or IMAGE_WORKERS <= 1:
+        return {
+            filename: process_image_to_base64(image, filename, **encode_kwargs)
+            for filename, image in images.items()
+        }
+    pool = _get_image_pool()
+    futures = {
+        filename: pool.submit(process_image_to_base64, image, filename, **encode_kwargs)
+        for filename, image in images.items()
+    }
+    return {filename: future.result() for filename, future in futures.items()}
+
+
+def render_images(
+    markdown: str, images: Dict[str, Image.Image], options: Dict[str, Any]
+) -> Tuple[str, Dict[str, str]]:
+    """
+    Encode extracted images as requested and keep the markdown references in sync.
+
+    Images re-encoded to another format get that format's extension, and the
+    markdown references (alt text and link) are rewritten to the new filenames.
+
+    Args:
+    markdown (str): The markdown produced by marker.
+    images (dict): Mapping of image filenames to PIL images.
+    options (dict): The conversion options.
+
+    Returns:
+    tuple: The markdown and a mapping of image filenames to base64 encoded images.
+    """
+    options = normalize_options(options)
+    if not options["extract_images"]:
+        return markdown, {}
+    image_data = encode_images(images, options)
+    _, extension = IMAGE_FORMATS[options["image_format"]]
+    renamed = {}
+    for filename, image_base64 in image_data.items():
+        new_filename = os.path.splitext(filename)[0] + extension
+        if new_filename != filename:
+            # marker names its images after themselves, ![name](name)
+            markdown = markdown.replace(
+                f"![{filename}]({filename})", f"![{new_filename}]({new_filename})"
+            )
+            markdown = markdown.replace(f"]({filename})", f"]({new_filename})")
+        renamed[new_filename] = image_base64
+    return markdown, renamed
+
+
+def get_page_count(pdf) -> int:
+    """
+    Read the page count of a PDF without running any model.
+
+    Args:
+    pdf: The PDF content as bytes, a file path or a file object.
+
+    Returns:
+    int: The number of pages.
+    """
+    doc = pdfium.PdfDocument(pdf)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def get_host_ram_available() -> int:
+    """
+    Get the RAM available to this process in MB, honouring container limits.
+
+    Returns:
+    int: The available RAM in MB.
+    """
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    if available is None:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+    # In a container (cgroup v2, then v1) the limit may be far below the host's RAM
+    for limit_path, usage_path in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        (
+            "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+            "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+        ),
+    ):
+        limit = _read_int(limit_path)
+        usage = _read_int(usage_path)
+        if limit is not None and usage is not None and limit < 2**60:
+            available = min(available, max(0, limit - usage))
+            break
+    return available // (1024**2)
+
+
 def get_ram_available():
     """
     Function to get VRAM/RAM availability on device
 
     Used to set the number of workers
 
+    Returns:
+    tuple: The device type and the free VRAM (GPU) or available RAM (CPU) in MB.
     """
 
     if torch.cuda.is_available():
@@ -68,9 +264,8 @@ def get_ram_available():
         return DeviceType.GPU, ram_available
 
     else:
-        # For CPU, use torch's built-in method to get total RAM available
-        ram_available = torch.cuda.memory_reserved() // (1024**2)  # Convert bytes to MB
-        return DeviceType.CPU, ram_available
+        # On CPU the models live in host RAM
+        return DeviceType.CPU, get_host_ram_available()
 
 
 # # Example usage:
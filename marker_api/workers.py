@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+from marker_api.breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Seconds between refreshes of the worker snapshot
+WORKER_REFRESH_INTERVAL = float(os.environ.get("MARKER_API_WORKER_REFRESH", "5"))
+# Seconds to wait for worker replies to each inspect broadcast
+WORKER_INSPECT_TIMEOUT = float(os.environ.get("MARKER_API_WORKER_TIMEOUT", "1"))
+
+
+class WorkerSnapshot:
+    """
+    Immutable view of the Celery cluster at the time of the last refresh.
+    """
+
+    def __init__(
+        self,
+        workers: Dict[str, Dict[str, Any]],
+        queue_depths: Dict[str, int],
+        updated_at: Optional[float],
+    ):
+        self.workers = workers
+        self.queue_depths = queue_depths
+        self.updated_at = updated_at
+
+    @property
+    def worker_count(self) -> int:
+        return len(self.workers)
+
+    @property
+    def concurrency(self) -> int:
+        return sum(worker["concurrency"] for worker in self.workers.values())
+
+    @property
+    def queued(self) -> int:
+        return sum(self.queue_depths.values())
+
+    @property
+    def outstanding(self) -> int:
+        """
+        Tasks not finished yet: waiting in the broker, prefetched or running.
+        """
+        return self.queued + sum(
+            worker["active"] + worker["reserved"] for worker in self.workers.values()
+        )
+
+    @property
+    def age(self) -> Optional[float]:
+        return None if self.updated_at is None else time.time() - self.updated_at
+
+
+class WorkerRegistry:
+    """
+    Keeps an in-memory snapshot of the live Celery workers.
+
+    A background thread broadcasts one inspect every `interval` seconds and
+    reads the depth of every consumed queue from the broker, so health checks
+    answer from memory instead of broadcasting to the workers per request.
+
+    Each refresh doubles as a liveness probe for `breaker`: an unreachable
+    broker or an empty cluster counts as a failure.
+    """
+
+    def __init__(
+        self,
+        app,
+        interval: float = WORKER_REFRESH_INTERVAL,
+        timeout: float = WORKER_INSPECT_TIMEOUT,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.app = app
+        self.breaker = breaker
+        self.interval = interval
+        self.timeout = timeout
+        self.snapshot = WorkerSnapshot({}, {}, None)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="marker-worker-registry", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(self.interval + self.timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                snapshot = self.refresh()
+                if self.breaker is not None:
+                    if snapshot.worker_count > 0:
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.record_failure("No Celery workers responded")
+            except Exception as e:
+                logger.warning(f"Failed to refresh Celery workers: {str(e)}")
+                self.snapshot = WorkerSnapshot({}, {}, time.time())
+                if self.breaker is not None:
+                    self.breaker.record_failure(str(e))
+            self._stop.wait(self.interval)
+
+    def refresh(self) -> WorkerSnapshot:
+        """
+        Query the workers and the broker once and replace the snapshot.
+
+        Returns:
+        WorkerSnapshot: The new snapshot.
+        """
+        # Fail fast on a dead broker instead of waiting on publish retries
+        with self.app.connection_for_read() as connection:
+            connection.ensure_connection(max_retries=1)
+
+        inspect = self.app.control.inspect(timeout=self.timeout)
+        stats = inspect.stats() or {}
+        active_queues = inspect.active_queues() or {}
+        active = inspect.active() or {}
+        # Prefetched by a worker, so no longer counted in the broker queue
+        reserved = inspect.reserved() or {}
+
+        workers = {}
+        queue_names = set()
+        for name, worker_stats in stats.items():
+            queues = [queue["name"] for queue in active_queues.get(name) or []]
+            queue_names.update(queues)
+            workers[name] = {
+                "concurrency": worker_stats.get("pool", {}).get("max-concurrency", 1),
+                "queues": queues,
+                "active": len(active.get(name) or []),
+                "reserved": len(reserved.get(name) or []),
+            }
+
+        self.snapshot = WorkerSnapshot(
+            workers, self._queue_depths(queue_names), time.time()
+        )
+        return self.snapshot
+
+    def _queue_depths(self, queue_names) -> Dict[str, int]:
+        depths = {}
+        if not queue_names:
+            return depths
+        with self.app.connection_for_read() as connection:
+            channel = connection.default_channel
+            for name in sorted(queue_names):
+                try:
+                    _, depth, _ = channel.queue_declare(queue=name, passive=True)
+                    depths[name] = depth
+                except Exception as e:
+                    logger.debug(f"Could not read depth of queue {name}: {str(e)}")
+        return depths
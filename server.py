@@ -1,43 +1,139 @@
 import os
+import time
 import asyncio
 import argparse
-from fastapi import FastAPI, UploadFile, File
+from fastapi import Depends, FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
-import concurrent.futures
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from marker.logger import configure_logging  # Import logging configuration
-from marker.models import load_all_models  # Import function to load models
-from marker_api.routes import (
-    process_pdf_file,
+from marker_api.routes import process_pdf_file, process_pdf_pages
+from marker_api.batching import install_batching
+from marker_api.cache import cache_key, lookup_result, store_result
+from marker_api.capacity import load_models_measured, plan_capacity
+from marker_api.coalesce import RequestCoalescer
+from marker_api.lazy_demo import demo_app, mount_demo
+from marker_api.compression import CompressionMiddleware
+from marker_api.delivery import (
+    NDJSON_MEDIA_TYPE,
+    ConversionJSONResponse,
+    STREAM_PAGES,
+    ndjson_line,
+    page_windows,
+    split_images,
+    zip_response,
+)
+from marker_api.executor import (
+    InferenceExecutor,
+    ProcessInferenceExecutor,
+    QueueFullError,
+    Reservation,
+    replica_start_method,
+)
+from marker_api.uploads import (
+    SpooledUpload,
+    UploadLimitMiddleware,
+    UploadTooLargeError,
+    remove_file,
+    spool_upload,
+    spool_uploads,
+    upload_too_large_handler,
+)
+from marker_api.utils import (
+    get_page_count,
+    normalize_options,
+    print_markerapi_text_art,
 )
-from marker_api.utils import print_markerapi_text_art
 from contextlib import asynccontextmanager
 import logging
-import gradio as gr
 from marker_api.model.schema import (
-    BatchConversionResponse,
+    ConversionOptions,
     ConversionResponse,
+    ConversionResultsResponse,
     HealthResponse,
+    ImageDelivery,
     ServerType,
 )
-from marker_api.demo import demo_ui
 
 # Initialize logging
 configure_logging()
 logger = logging.getLogger(__name__)
 
-# Global variable to hold model list
+# Global variables to hold the model list and the executor that runs inference
 model_list = None
+inference_executor = None
+
+# Inference executor sizing, overridable from the command line; "auto" sizes the
+# executor from the memory left after loading the models
+INFERENCE_WORKERS = os.environ.get("MARKER_API_INFERENCE_WORKERS", "2")
+MAX_QUEUE = int(os.environ.get("MARKER_API_MAX_QUEUE", "8"))
+RETRY_AFTER = os.environ.get("MARKER_API_RETRY_AFTER", "10")
+# Model replica processes: 0 runs inference on threads, "auto" sizes from free memory
+REPLICAS = os.environ.get("MARKER_API_REPLICAS", "0")
+# Model stages batched across concurrent conversions, read here rather than from
+# marker_api.batching, which was imported before main() could set it
+DYNAMIC_BATCHING = os.environ.get("MARKER_API_DYNAMIC_BATCHING", "")
+# Serve the Gradio demo UI at /, read here for the same reason
+DEMO = os.environ.get("MARKER_API_DEMO", "false").lower() in ("1", "true", "yes")
+
+# Identical uploads that arrive while a conversion is running share its result
+coalescer = RequestCoalescer()
 
 
 # Event that runs on startup to load all models
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global model_list
+    global model_list, inference_executor
     logger.debug("--------------------- Loading OCR Model -----------------------")
     print_markerapi_text_art()
-    model_list = load_all_models()
+    if REPLICAS != "0":
+        start_method = replica_start_method()
+        shared_weights = start_method == "fork"
+        # Forked replicas share the weights loaded here copy-on-write
+        model_list, replica_mb = (
+            load_models_measured() if shared_weights else (None, None)
+        )
+        if REPLICAS == "auto":
+            plan = plan_capacity(replica_mb, models_loaded=shared_weights)
+            replicas = plan.replicas(shared_weights)
+        else:
+            replicas = int(REPLICAS)
+        inference_executor = ProcessInferenceExecutor(
+            model_list,
+            replicas=replicas,
+            max_queue=MAX_QUEUE,
+            start_method=start_method,
+        )
+        await asyncio.to_thread(inference_executor.warm_up)
+    else:
+        model_list, replica_mb = load_models_measured()
+        if INFERENCE_WORKERS == "auto":
+            workers = plan_capacity(replica_mb, models_loaded=True).conversions
+        else:
+            workers = int(INFERENCE_WORKERS)
+        # Concurrent conversions share model calls, which needs more than one worker
+        if install_batching(DYNAMIC_BATCHING) and workers < 2:
+            logger.warning(
+                "Dynamic batching has no effect with a single inference worker"
+            )
+        inference_executor = InferenceExecutor(
+            model_list, max_workers=workers, max_queue=MAX_QUEUE
+        )
     yield
+    inference_executor.shutdown(wait=False)
+    await demo_app.close()
+
+
+def queue_full_exception(e: QueueFullError) -> HTTPException:
+    """
+    Build the 503 response returned when the inference queue is saturated.
+    """
+    logger.warning(str(e))
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please retry later",
+        headers={"Retry-After": RETRY_AFTER},
+    )
 
 
 # Initialize FastAPI app
@@ -51,8 +147,11 @@ app.add_middleware(
     allow_headers=["*"],
     allow_credentials=True,
 )
-
-app = gr.mount_gradio_app(app, demo_ui, path="")
+# Oversized bodies are refused before they are read, files are capped while spooled
+app.add_middleware(UploadLimitMiddleware)
+app.add_exception_handler(UploadTooLargeError, upload_too_large_handler)
+# Markdown and base64 images compress well, for clients that accept it
+app.add_middleware(CompressionMiddleware)
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -65,37 +164,221 @@ def server():
 
 # Endpoint to convert a single PDF to markdown
 @app.post("/convert", response_model=ConversionResponse)
-async def convert_pdf_to_markdown(pdf_file: UploadFile):
+async def convert_pdf_to_markdown(
+    pdf_file: UploadFile,
+    image_delivery: ImageDelivery = ImageDelivery.base64,
+    options: ConversionOptions = Depends(),
+):
     """
     Endpoint to convert a single PDF to markdown.
+
+    With `image_delivery=zip` the response is a zip archive holding the JSON body
+    as result.json, whose images map to the paths of the raw image files.
     """
     logger.debug(f"Received file: {pdf_file.filename}")
-    file = await pdf_file.read()
-    response = process_pdf_file(file, pdf_file.filename, model_list)
-    return ConversionResponse(status="Success", result=response)
+    upload = await spool_upload(pdf_file)
+    try:
+        options = normalize_options(options.model_dump())
+        key = cache_key(upload.digest, options)
+        # Cache hits are answered without taking a slot on the inference executor
+        response = await asyncio.to_thread(lookup_result, key, upload.filename)
+        if response is None:
+            response = await convert_uncached(upload, options, key)
+    finally:
+        upload.close()
+    if image_delivery == ImageDelivery.zip:
+        results, files = split_images([response])
+        return await zip_response({"status": "Success", "result": results[0]}, files)
+    return ConversionJSONResponse({"status": "Success", "result": response})
+
+
+def submit_conversion(
+    upload: SpooledUpload,
+    options: dict,
+    key: str,
+    reservation: Optional[Reservation] = None,
+):
+    """
+    Start a conversion on the inference executor and cache its result.
+
+    The result is cached here rather than by the job itself, so conversions run in
+    replica processes still land in this process's cache. The conversion takes
+    over the spooled file, as it may outlive the request that uploaded it.
+
+    Args:
+    reservation (Reservation): Slots of the request to run on, with one acquired.
+
+    Returns:
+    asyncio.Future: A future resolving to the cached result.
+    """
+    submit = inference_executor.submit if reservation is None else reservation.submit
+    future = submit(
+        process_pdf_file,
+        upload.path,
+        upload.filename,
+        options=options,
+    )
+    path = upload.detach()
+
+    async def store():
+        try:
+            result = await future
+        finally:
+            await asyncio.to_thread(remove_file, path)
+        return await asyncio.to_thread(store_result, key, result)
+
+    return asyncio.ensure_future(store())
+
+
+async def convert_uncached(upload: SpooledUpload, options: dict, key: str):
+    """
+    Run a conversion on the inference executor, sharing it with identical uploads.
+    """
+    try:
+        future, coalesced = coalescer.attach(
+            key, lambda: submit_conversion(upload, options, key)
+        )
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+    return await coalescer.wait(future, upload.filename, coalesced)
+
+
+# Endpoint to stream the markdown of a single PDF as pages are converted
+@app.post("/convert/stream")
+async def convert_pdf_to_markdown_stream(
+    pdf_file: UploadFile,
+    pages_per_chunk: int = Query(STREAM_PAGES, ge=1),
+    options: ConversionOptions = Depends(),
+):
+    """
+    Endpoint to convert a single PDF to markdown, streamed as NDJSON.
+
+    Emits one `pages` event per chunk of `pages_per_chunk` pages as soon as it is
+    converted, then a final `done` event (or an `error` event).
+    """
+    logger.debug(f"Received file for streaming: {pdf_file.filename}")
+    upload = await spool_upload(pdf_file)
+    filename = upload.filename
+    options = normalize_options(options.model_dump())
+    try:
+        page_count = await asyncio.to_thread(get_page_count, upload.path)
+        try:
+            inference_executor.check_capacity()
+        except QueueFullError as e:
+            raise queue_full_exception(e)
+    except BaseException:
+        upload.close()
+        raise
+    # Removed once the stream ends, every chunk is converted from the same file
+    path = upload.detach()
+
+    async def events():
+        entry_time = time.time()
+        try:
+            for start_page, max_pages in page_windows(page_count, pages_per_chunk):
+                try:
+                    chunk = await inference_executor.run(
+                        process_pdf_pages,
+                        path,
+                        filename,
+                        start_page,
+                        max_pages,
+                        options=options,
+                    )
+                except Exception as e:
+                    logger.error(f"Error streaming {filename}: {str(e)}")
+                    yield ndjson_line({"type": "error", "message": str(e)})
+                    return
+                yield ndjson_line({"type": "pages", **chunk})
+            yield ndjson_line(
+                {
+                    "type": "done",
+                    "filename": filename,
+                    "pages": page_count,
+                    "time": time.time() - entry_time,
+                }
+            )
+        finally:
+            await asyncio.to_thread(remove_file, path)
+
+    return StreamingResponse(events(), media_type=NDJSON_MEDIA_TYPE)
 
 
 # Endpoint to convert multiple PDFs to markdown
-@app.post("/batch_convert", response_model=BatchConversionResponse)
-async def convert_pdfs_to_markdown(pdf_files: List[UploadFile] = File(...)):
+@app.post("/batch_convert", response_model=ConversionResultsResponse)
+async def convert_pdfs_to_markdown(
+    pdf_files: List[UploadFile] = File(...),
+    image_delivery: ImageDelivery = ImageDelivery.base64,
+    options: ConversionOptions = Depends(),
+):
     """
     Endpoint to convert multiple PDFs to markdown.
+
+    With `image_delivery=zip` the images of the n-th result live under `<n>/images/`.
     """
     logger.debug(f"Received {len(pdf_files)} files for batch conversion")
+    # Spooled to disk one file at a time, so memory stays flat whatever the batch size
+    uploads = await spool_uploads(pdf_files)
+    try:
+        options = normalize_options(options.model_dump())
+        keys = [cache_key(upload.digest, options) for upload in uploads]
+        cached = await asyncio.gather(
+            *[
+                asyncio.to_thread(lookup_result, key, upload.filename)
+                for key, upload in zip(keys, uploads)
+            ]
+        )
+        misses = [i for i, result in enumerate(cached) if result is None]
+        new_keys = {keys[i] for i in misses if not coalescer.is_inflight(keys[i])}
 
-    async def process_files(files):
-        loop = asyncio.get_event_loop()
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
-            coroutines = [
-                loop.run_in_executor(
-                    pool, process_pdf_file, await file.read(), file.filename, model_list
+        # The batch takes whatever room the queue has, even a single slot, and runs
+        # its conversions through those slots one after another. It is only rejected
+        # when the queue is full, so a rejected batch leaves no work behind.
+        reservation = None
+        if new_keys:
+            try:
+                reservation = inference_executor.reserve(len(new_keys))
+            except QueueFullError as e:
+                raise queue_full_exception(e)
+
+        async def convert(i: int):
+            upload, key = uploads[i], keys[i]
+            if reservation is None or coalescer.is_inflight(key):
+                future, coalesced = coalescer.attach(
+                    key, lambda: submit_conversion(upload, options, key)
                 )
-                for file in files
-            ]
-            return await asyncio.gather(*coroutines)
+            else:
+                await reservation.acquire()
+                future, coalesced = coalescer.attach(
+                    key, lambda: submit_conversion(upload, options, key, reservation)
+                )
+                if coalesced:
+                    # Started by someone else while this one waited for a slot
+                    reservation.release()
+            return await coalescer.wait(future, upload.filename, coalesced)
+
+        try:
+            converted = await asyncio.gather(*[convert(i) for i in misses])
+        except QueueFullError as e:
+            raise queue_full_exception(e)
+        finally:
+            if reservation is not None:
+                reservation.close()
+        responses = list(cached)
+        for i, response in zip(misses, converted):
+            responses[i] = response
+    finally:
+        for upload in uploads:
+            upload.close()
+    if image_delivery == ImageDelivery.zip:
+        results, files = split_images(responses, nested=True)
+        return await zip_response({"status": "Success", "results": results}, files)
+    return ConversionJSONResponse({"status": "Success", "results": responses})
 
-    responses = await process_files(pdf_files)
-    return BatchConversionResponse(results=responses)
+
+# The demo UI is mounted at the root, so it must come after every API route
+if DEMO:
+    mount_demo(app)
 
 
 # Main function to run the server
@@ -103,8 +386,44 @@ def main():
     parser = argparse.ArgumentParser(description="Run the marker-api server.")
     parser.add_argument("--host", default="0.0.0.0", help="Host IP address")
     parser.add_argument("--port", type=int, default=8080, help="Port number")
+    parser.add_argument(
+        "--inference-workers",
+        default=INFERENCE_WORKERS,
+        help='Number of conversions that run concurrently, "auto" to size from memory',
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=MAX_QUEUE,
+        help="Number of conversions that may wait before requests are rejected",
+    )
+    parser.add_argument(
+        "--dynamic-batching",
+        default=DYNAMIC_BATCHING,
+        help='Model stages batched across concurrent conversions, e.g. "all" or '
+        '"detection,recognition"',
+    )
+    parser.add_argument(
+        "--replicas",
+        default=REPLICAS,
+        help='Model replica processes, "auto" to size from free memory, '
+        "0 to run inference on threads",
+    )
+    parser.add_argument(
+        "--demo",
+        action="store_true",
+        default=DEMO,
+        help="Serve the Gradio demo UI at /",
+    )
     args = parser.parse_args()
 
+    # uvicorn re-imports this module, so hand the settings over via the environment
+    os.environ["MARKER_API_INFERENCE_WORKERS"] = str(args.inference_workers)
+    os.environ["MARKER_API_MAX_QUEUE"] = str(args.max_queue)
+    os.environ["MARKER_API_DYNAMIC_BATCHING"] = args.dynamic_batching
+    os.environ["MARKER_API_REPLICAS"] = str(args.replicas)
+    os.environ["MARKER_API_DEMO"] = str(args.demo).lower()
+
     import uvicorn
 
     uvicorn.run("server:app", host=args.host, port=args.port)